@@ -1,21 +1,1856 @@
 import sys
 import os
+import io
+import time
+import errno
+import shutil
+import argparse
+import json
+import plistlib
+import subprocess
+import struct
 import datetime
+import sqlite3
+import bisect
+import multiprocessing
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from PyQt5.QtWidgets import (
-    QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QListWidget,
-    QPushButton, QGridLayout, QDateEdit, QFileDialog, QMessageBox, QListWidgetItem,
-    QLabel, QGestureEvent, QPinchGesture
+    QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QListView,
+    QPushButton, QGridLayout, QDateEdit, QFileDialog, QMessageBox, QAbstractItemView,
+    QLabel, QGestureEvent, QPinchGesture, QComboBox, QCheckBox, QStackedWidget
 )
-from PyQt5.QtCore import Qt, QSize, QDate, QPointF, QEvent, QByteArray, QBuffer
-from PyQt5.QtGui import QPixmap, QIcon, QImageReader, QImage
+from PyQt5.QtCore import (
+    Qt, QSize, QDate, QPointF, QEvent, QObject, QTimer,
+    QThread, QAbstractListModel, QModelIndex, QFileSystemWatcher, pyqtSignal
+)
+from PyQt5.QtGui import QPixmap, QImageReader, QImage
 from PyQt5.QtWidgets import QApplication, QGraphicsView
 from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QColor, QPainter, QPicture
-from PIL import Image
-from PIL.ExifTags import TAGS
+from PIL import Image, features
 import hashlib
+import numpy as np
 from diskcache import Cache
-from PIL.ImageQt import ImageQt
+
+
+# 每个用户的缓存目录，程序所在目录可能不可写
+def user_cache_folder():
+    if sys.platform == "darwin":
+        base = os.path.expanduser("~/Library/Caches")
+    elif sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~\\AppData\\Local")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "SDCardQuickView")
+
+
+# 缩略图缓存和元数据索引都放在用户缓存目录
+APP_FOLDER = os.path.dirname(os.path.abspath(__file__))
+THUMBNAIL_CACHE_FOLDER = os.path.join(user_cache_folder(), "thumbnails")
+METADATA_INDEX_PATH = os.path.join(user_cache_folder(), "metadata.sqlite3")
+
+# 缩略图缓存的容量上限和条目最长保留时间，超出后按最近最少使用淘汰
+THUMBNAIL_CACHE_BYTES = 1024 * 1024 * 1024
+THUMBNAIL_CACHE_MAX_AGE = 180 * 24 * 3600
+
+# 照片缩略图用 WebP 比 PNG 小好几倍
+THUMBNAIL_FORMAT = "WEBP" if features.check("webp") else "JPEG"
+THUMBNAIL_QUALITY = 80
+
+# 感知哈希（dHash，64 位）和缩略图一起缓存，用这个键代替缩略图尺寸
+HASH_KEY = "dhash"
+# 汉明距离不超过此值、拍摄时间相差不超过此秒数的照片视为连拍或近似重复
+HASH_DISTANCE = 10
+BURST_WINDOW_SECONDS = 10
+# 时间窗口内最多和之后多少张比较
+BURST_MAX_NEIGHBORS = 256
+
+# 导入：读卡器同时读太多文件反而更慢，所以只用很少的线程
+INGEST_WORKERS = 2
+INGEST_CHUNK_BYTES = 4 * 1024 * 1024
+INGEST_MANIFEST = ".quickview_manifest.json"
+# 每完成这么多组就保存一次清单，中断后可以接着导入
+INGEST_SAVE_EVERY = 50
+
+# 缩略图解码使用的进程数
+THUMBNAIL_WORKERS = os.cpu_count() or 4
+
+# 缓存中为每张照片保存的缩略图尺寸，缩放时从最接近的较大一级缩小
+THUMBNAIL_LEVELS = (128, 256, 512)
+MIN_THUMBNAIL_SIZE = 48
+MAX_THUMBNAIL_SIZE = THUMBNAIL_LEVELS[-1]
+
+# PIL 无法直接解码的 RAW 格式，只能依赖内嵌的 JPEG 预览图
+RAW_EXTENSIONS = frozenset((
+    ".3fr", ".ari", ".arw", ".bay", ".cap", ".cr2", ".cr3", ".crw", ".dcr", ".dcs",
+    ".dng", ".drf", ".eip", ".erf", ".fff", ".gpr", ".iiq", ".k25", ".kdc", ".mdc",
+    ".mef", ".mos", ".mrw", ".nef", ".nrw", ".orf", ".pef", ".ptx", ".pxn", ".r3d",
+    ".raf", ".raw", ".rwl", ".rw2", ".rwz", ".sr2", ".srf", ".srw", ".x3f", ".hif",
+))
+
+IMAGE_EXTENSIONS = frozenset((".png", ".jpg", ".jpeg", ".gif", ".bmp", ".tif")) | RAW_EXTENSIONS
+
+# 扫描时跳过的目录（隐藏目录之外）
+SKIPPED_DIRECTORIES = frozenset(("System Volume Information", "$RECYCLE.BIN", "LOST.DIR", "__pycache__"))
+
+# 扫描结果按批次送到界面
+SCAN_BATCH_SIZE = 500
+SCAN_BATCH_SECONDS = 0.2
+
+# 删除的照片先移到所打开文件夹下的这个目录，方便撤销
+TRASH_FOLDER = ".quickview_trash"
+
+# inotify 等机制的监视数量有限
+MAX_WATCHED_DIRECTORIES = 2000
+
+# 读取元数据的线程数，SD 卡读取是瓶颈，不需要太多
+METADATA_WORKERS = 8
+
+# 大图预览：解码线程数、前后预取的张数和解码结果缓存的内存上限
+PREVIEW_WORKERS = 3
+PREVIEW_PREFETCH = 3
+PREVIEW_CACHE_BYTES = 512 * 1024 * 1024
+# 大图预览先按这个尺寸快速解码，再换成完整尺寸
+PREVIEW_QUICK_SIZE = 1024
+
+# 每个文件读取 EXIF 头部的字节上限
+EXIF_READ_BUDGET = 256 * 1024
+
+# 在无法解析的格式（CR3、HEIF 等）中查找 JPEG 预览图时扫描的字节数
+PREVIEW_SCAN_BYTES = 4 * 1024 * 1024
+# 足以读到内嵌 JPEG 的 SOF 标记，即使前面还有它自己的 EXIF
+PREVIEW_HEADER_BYTES = 64 * 1024
+
+
+# 只解析 IFD 的最小 TIFF 读取器，用于 JPEG 中的 EXIF 和基于 TIFF 的 RAW 文件
+class TiffReader:
+    TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8, 13: 4}
+    TYPE_FORMATS = {3: "H", 4: "I", 8: "h", 9: "i", 13: "I"}
+
+    def __init__(self, f, base=0):
+        self.f = f
+        self.base = base
+        f.seek(base)
+        header = f.read(8)
+        if header[:2] == b"II":
+            self.endian = "<"
+        elif header[:2] == b"MM":
+            self.endian = ">"
+        else:
+            raise ValueError("not a TIFF structure")
+        # 不检查魔数：ORF 和 RW2 使用自己的值
+        self.first_ifd = struct.unpack(self.endian + "I", header[4:8])[0]
+
+    # 返回 ({tag: (type, count, field)}, 下一个 IFD 的偏移)
+    def read_ifd(self, offset):
+        self.f.seek(self.base + offset)
+        count = struct.unpack(self.endian + "H", self.f.read(2))[0]
+        if count > 1000:
+            raise ValueError("implausible IFD entry count")
+        data = self.f.read(count * 12 + 4)
+        entries = {}
+        for i in range(count):
+            tag, type_, n = struct.unpack(self.endian + "HHI", data[i * 12:i * 12 + 8])
+            entries[tag] = (type_, n, data[i * 12 + 8:i * 12 + 12])
+        next_ifd = struct.unpack(self.endian + "I", data[count * 12:count * 12 + 4])[0]
+        return entries, next_ifd
+
+    # 值所在的文件偏移，值直接存放在条目中时返回 None
+    def value_offset(self, entry):
+        type_, count, field = entry
+        if self.TYPE_SIZES.get(type_, 1) * count <= 4:
+            return None
+        return self.base + struct.unpack(self.endian + "I", field)[0]
+
+    # 解码条目的值
+    def value(self, entry, max_bytes=4096):
+        type_, count, field = entry
+        size = self.TYPE_SIZES.get(type_, 1) * count
+        if size > max_bytes:
+            raise ValueError("value too large")
+        offset = self.value_offset(entry)
+        if offset is None:
+            raw = field[:size]
+        else:
+            self.f.seek(offset)
+            raw = self.f.read(size)
+        if type_ == 2:
+            return raw.split(b"\0", 1)[0].decode("ascii", "replace").strip()
+        if type_ in (1, 6, 7):
+            return raw
+        if type_ in (5, 10):
+            fmt = "I" if type_ == 5 else "i"
+            values = struct.unpack("%s%d%s" % (self.endian, count * 2, fmt), raw)
+            return tuple(values[i] / values[i + 1] if values[i + 1] else 0 for i in range(0, len(values), 2))
+        fmt = self.TYPE_FORMATS.get(type_)
+        if fmt is None:
+            return raw
+        return struct.unpack("%s%d%s" % (self.endian, count, fmt), raw)
+
+    def first(self, entries, tag, default=None):
+        if tag not in entries:
+            return default
+        value = self.value(entries[tag])
+        return value[0] if isinstance(value, tuple) and value else default
+
+
+# 所有 IFD 引用的 JPEG 预览图的 (偏移, 长度)
+def _tiff_preview_candidates(reader):
+    candidates = []
+    queue = [reader.first_ifd]
+    seen = set()
+    while queue and len(seen) < 32:
+        offset = queue.pop(0)
+        if not offset or offset in seen:
+            continue
+        seen.add(offset)
+        entries, next_ifd = reader.read_ifd(offset)
+        queue.append(next_ifd)
+        if 0x014A in entries:  # SubIFDs
+            queue.extend(reader.value(entries[0x014A]))
+        if 0x0201 in entries and 0x0202 in entries:  # JPEGInterchangeFormat(Length)
+            candidates.append((
+                reader.base + reader.first(entries, 0x0201), reader.first(entries, 0x0202)
+            ))
+        compression = reader.first(entries, 0x0103)
+        photometric = reader.first(entries, 0x0106)
+        # JPEG 压缩的图像条，不包括 CFA / 线性 RAW 数据本身
+        if compression in (6, 7) and photometric not in (32803, 34892) \
+                and 0x0111 in entries and 0x0117 in entries:
+            offsets = reader.value(entries[0x0111])
+            counts = reader.value(entries[0x0117])
+            if len(offsets) == 1:
+                candidates.append((reader.base + offsets[0], counts[0]))
+        if 0x002E in entries:  # Panasonic JpgFromRaw
+            offset = reader.value_offset(entries[0x002E])
+            if offset is not None:
+                candidates.append((offset, entries[0x002E][1]))
+    return candidates
+
+
+# JPEG 的 EXIF 段中 IFD1 缩略图的位置
+def _jpeg_exif_candidates(f):
+    f.seek(2)
+    while True:
+        marker = f.read(4)
+        if len(marker) < 4 or marker[0] != 0xFF or marker[1] in (0xD9, 0xDA):
+            return []
+        length = struct.unpack(">H", marker[2:])[0]
+        segment_end = f.tell() + length - 2
+        if marker[1] == 0xE1 and f.read(6) == b"Exif\0\0":
+            reader = TiffReader(f, f.tell())
+            entries, next_ifd = reader.read_ifd(reader.first_ifd)
+            if not next_ifd:
+                return []
+            entries, _ = reader.read_ifd(next_ifd)
+            offset = reader.first(entries, 0x0201)
+            length = reader.first(entries, 0x0202)
+            return [(reader.base + offset, length)] if offset and length else []
+        f.seek(segment_end)
+
+
+# 在不解析的格式（CR3、HEIF 等）头部直接查找 JPEG 数据
+def _scan_preview_candidates(f):
+    f.seek(0)
+    data = f.read(PREVIEW_SCAN_BYTES)
+    candidates = []
+    start = data.find(b"\xff\xd8\xff", 1)
+    while start != -1:
+        candidates.append((start, len(data) - start))
+        start = data.find(b"\xff\xd8\xff", start + 3)
+    return candidates
+
+
+# 文件中所有内嵌 JPEG 预览图的 (偏移, 长度)
+# ORF、PEF 等 RAW 的预览图在 MakerNote 里，IFD 中找不到时直接查找 JPEG 数据
+def embedded_preview_candidates(f, is_raw=False):
+    f.seek(0)
+    head = f.read(16)
+    try:
+        if head.startswith(b"\xff\xd8"):
+            return _jpeg_exif_candidates(f)
+        if head[:4] in (b"II*\0", b"MM\0*", b"IIRO", b"IIRS", b"IIU\0"):
+            candidates = _tiff_preview_candidates(TiffReader(f))
+            if not candidates and is_raw:
+                return _scan_preview_candidates(f)
+            return candidates
+        if head.startswith(b"FUJIFILMCCD-RAW"):
+            f.seek(84)
+            offset, length = struct.unpack(">II", f.read(8))
+            return [(offset, length)]
+        if head[:4] in (b"\x89PNG", b"GIF8") or head[:2] == b"BM":
+            return []
+        return _scan_preview_candidates(f)
+    except (struct.error, ValueError, OSError):
+        return []
+
+
+def _open_embedded_jpeg(f, offset, length, max_bytes=None):
+    f.seek(offset)
+    data = f.read(length if max_bytes is None else min(length, max_bytes))
+    if not data.startswith(b"\xff\xd8"):
+        raise ValueError("not a JPEG stream")
+    image = Image.open(io.BytesIO(data))
+    if image.format != "JPEG":
+        raise ValueError("not a JPEG stream")
+    return image
+
+
+# 返回不超过 size 的 PIL 图片，依次尝试：足够大的内嵌预览图、JPEG 缩小解码、完整解码
+# 无法解码的 RAW 文件使用最大的内嵌预览图
+def extract_thumbnail(image_path, size):
+    is_raw = os.path.splitext(image_path)[1].lower() in RAW_EXTENSIONS
+    with open(image_path, "rb") as f:
+        previews = []
+        for offset, length in embedded_preview_candidates(f, is_raw):
+            try:
+                header = _open_embedded_jpeg(f, offset, length, PREVIEW_HEADER_BYTES)
+            except (OSError, ValueError, SyntaxError):
+                continue
+            previews.append((max(header.size), offset, length))
+        previews.sort()
+
+        # 足够大的最小预览图，没有时（仅 RAW）取最大的
+        usable = [p for p in previews if p[0] >= size]
+        if not usable and is_raw:
+            usable = previews[-1:]
+        for _, offset, length in usable:
+            try:
+                image = _open_embedded_jpeg(f, offset, length)
+                image.draft("RGB", (size, size))
+                image.thumbnail((size, size), Image.LANCZOS)
+                image.load()
+                return image
+            except (OSError, ValueError, SyntaxError):
+                continue
+
+    with Image.open(image_path) as image:
+        # JPEG 会按 1/2、1/4 或 1/8 缩小解码
+        image.draft("RGB", (size, size))
+        image.thumbnail((size, size), Image.LANCZOS)
+        # 图片本来就足够小时 thumbnail() 不会加载像素
+        image.load()
+        return image
+
+
+def is_image_file(name):
+    return os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+
+
+def is_skipped_directory(name):
+    return name.startswith(".") or name in SKIPPED_DIRECTORIES
+
+
+# 用 os.scandir 遍历文件夹，分批返回 (目录, 图片路径)，跳过隐藏和系统目录
+def iter_image_batches(folder, stop=None):
+    stack = [folder]
+    directories = []
+    image_paths = []
+    flushed_at = time.monotonic()
+    while stack:
+        if stop is not None and stop():
+            return
+        directory = stack.pop()
+        directories.append(directory)
+        try:
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError:
+            continue
+        subdirectories = []
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if not is_skipped_directory(entry.name):
+                        subdirectories.append(entry.path)
+                elif is_image_file(entry.name):
+                    image_paths.append(entry.path)
+            except OSError:
+                continue
+        # 深度优先，按名称顺序
+        stack.extend(reversed(subdirectories))
+        if len(image_paths) >= SCAN_BATCH_SIZE or time.monotonic() - flushed_at >= SCAN_BATCH_SECONDS:
+            yield directories, image_paths
+            directories, image_paths = [], []
+            flushed_at = time.monotonic()
+    if directories or image_paths:
+        yield directories, image_paths
+
+
+# 扫描顺序的排序键：目录内的图片在子目录之前，都按名称排列
+def scan_order_key(image_path):
+    directory, name = os.path.split(image_path)
+    return directory.split(os.sep), name
+
+
+# 按扫描顺序返回文件夹下的所有图片
+def create_image_list(folder):
+    return [path for _, image_paths in iter_image_batches(folder) for path in image_paths]
+
+
+# 同一目录下同名的文件（IMG_0001.CR3 / IMG_0001.JPG）为一组
+def pair_key(image_path):
+    return os.path.splitext(image_path)[0].lower()
+
+
+# {pair_key: [路径]}，例如 RAW 文件和对应的 JPEG
+def group_pairs(image_paths):
+    pairs = OrderedDict()
+    for image_path in image_paths:
+        pairs.setdefault(pair_key(image_path), []).append(image_path)
+    return pairs
+
+
+# 可移动存储卡的挂载目录
+def volume_roots():
+    if sys.platform == "darwin":
+        return ["/Volumes"]
+    user = os.environ.get("USER", "")
+    roots = [os.path.join("/media", user), os.path.join("/run/media", user), "/media", "/mnt"]
+    return [root for root in roots if os.path.isdir(root)]
+
+
+def mounted_volumes():
+    if sys.platform == "win32":
+        import ctypes
+        mask = ctypes.windll.kernel32.GetLogicalDrives()
+        return {"%s:\\" % chr(ord("A") + i) for i in range(26) if mask >> i & 1}
+    volumes = set()
+    for root in volume_roots():
+        try:
+            with os.scandir(root) as it:
+                volumes.update(entry.path for entry in it if os.path.ismount(entry.path))
+        except OSError:
+            continue
+    return volumes
+
+
+# 不小于 size 的最小缓存尺寸，都不够时取最大
+def thumbnail_level(size):
+    for level in THUMBNAIL_LEVELS:
+        if level >= size:
+            return level
+    return THUMBNAIL_LEVELS[-1]
+
+
+# 路径加大小、修改时间和 inode，文件被修改或替换后缓存自然失效
+def file_identity(image_path):
+    st = os.stat(image_path)
+    return (image_path, st.st_size, st.st_mtime_ns, st.st_ino)
+
+
+def encode_thumbnail(image):
+    buffer = io.BytesIO()
+    if THUMBNAIL_FORMAT == "WEBP":
+        image.save(buffer, "WEBP", quality=THUMBNAIL_QUALITY, method=4)
+    elif image.mode == "RGBA":
+        image.save(buffer, "PNG")
+    else:
+        image.save(buffer, "JPEG", quality=THUMBNAIL_QUALITY)
+    return buffer.getvalue()
+
+
+# 64 位差值哈希：9x8 灰度图中相邻像素的明暗关系
+def dhash(image, size=8):
+    pixels = np.asarray(image.convert("L").resize((size + 1, size), Image.BOX), dtype=np.int16)
+    bits = pixels[:, 1:] > pixels[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+# 一次解码生成所有尺寸的缩略图和 dHash，在子进程中运行
+def generate_thumbnail_pyramid(image_path, levels=THUMBNAIL_LEVELS):
+    image = extract_thumbnail(image_path, max(levels))
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+    pyramid = {}
+    for level in sorted(levels, reverse=True):
+        # 每一级都从上一级更大的缩略图缩小
+        image.thumbnail((level, level), Image.LANCZOS)
+        pyramid[level] = encode_thumbnail(image)
+    pyramid[HASH_KEY] = dhash(image)
+    return pyramid
+
+
+# 同时返回子进程内的耗时
+def timed_thumbnail_pyramid(image_path):
+    started = time.perf_counter()
+    pyramid = generate_thumbnail_pyramid(image_path)
+    return pyramid, time.perf_counter() - started
+
+
+def mount_point(path):
+    path = os.path.realpath(path)
+    while not os.path.ismount(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return path
+
+
+_volume_ids = {}
+
+
+# 存储卡的唯一标识（UUID 或序列号）
+def volume_id(mount):
+    if mount in _volume_ids:
+        return _volume_ids[mount]
+    identifier = None
+    try:
+        if sys.platform == "win32":
+            import ctypes
+            serial = ctypes.c_uint32()
+            if ctypes.windll.kernel32.GetVolumeInformationW(
+                mount, None, 0, ctypes.byref(serial), None, None, None, 0
+            ):
+                identifier = "%08X" % serial.value
+        elif sys.platform == "darwin":
+            output = subprocess.run(
+                ["diskutil", "info", "-plist", mount], capture_output=True, timeout=5
+            ).stdout
+            identifier = plistlib.loads(output).get("VolumeUUID")
+        else:
+            device = os.stat(mount).st_dev
+            with os.scandir("/dev/disk/by-uuid") as it:
+                for entry in it:
+                    if os.stat(entry.path).st_rdev == device:
+                        identifier = entry.name
+                        break
+    except (OSError, ValueError, subprocess.SubprocessError, plistlib.InvalidFileException):
+        pass
+    if identifier is None:
+        identifier = "dev-%x" % os.stat(mount).st_dev
+    _volume_ids[mount] = identifier
+    return identifier
+
+
+# 缓存按存储卡分区：卷标识加上 DCIM 在卷上的路径
+def volume_namespace(folder):
+    mount = mount_point(folder)
+    parts = os.path.relpath(os.path.realpath(folder), mount).split(os.sep)
+    upper = [part.upper() for part in parts]
+    if "DCIM" in upper:
+        parts = parts[:upper.index("DCIM") + 1]
+    return "%s:%s" % (volume_id(mount), "/".join(parts))
+
+
+# 基于 diskcache 的缩略图缓存：按最近最少使用淘汰，过期清理，按存储卡打标签
+class ThumbnailCache:
+    def __init__(self, folder, size_limit=THUMBNAIL_CACHE_BYTES, max_age=THUMBNAIL_CACHE_MAX_AGE):
+        self.cache = Cache(
+            folder, size_limit=size_limit, eviction_policy="least-recently-used",
+            cull_limit=0, tag_index=True,
+        )
+        self.max_age = max_age
+        self.namespace = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.decoded = 0
+        self.decode_seconds = 0.0
+
+    def get(self, key):
+        value = self.cache.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def __contains__(self, key):
+        return key in self.cache
+
+    def store_pyramid(self, identity, pyramid, decode_seconds=None):
+        with self.cache.transact():
+            for level, data in pyramid.items():
+                self.cache.set(identity + (level,), data, expire=self.max_age, tag=self.namespace)
+        if decode_seconds is not None:
+            self.decoded += 1
+            self.decode_seconds += decode_seconds
+
+    # 与缩略图一起缓存的 dHash，旧的缓存条目从最小的缩略图计算
+    def image_hash(self, identity):
+        value = self.cache.get(identity + (HASH_KEY,))
+        if value is None:
+            data = self.cache.get(identity + (min(THUMBNAIL_LEVELS),))
+            if data is not None:
+                value = dhash(Image.open(io.BytesIO(data)))
+                self.cache.set(identity + (HASH_KEY,), value, expire=self.max_age, tag=self.namespace)
+        return value
+
+    def delete(self, key):
+        return self.cache.delete(key)
+
+    def transact(self):
+        return self.cache.transact()
+
+    # 清理过期条目，再淘汰到容量上限以内
+    def maintain(self):
+        self.evictions += self.cache.expire() + self.cache.cull()
+
+    def drop_namespace(self, namespace):
+        return self.cache.evict(namespace)
+
+    def clear(self):
+        return self.cache.clear()
+
+    def close(self):
+        self.cache.close()
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "bytes": self.cache.volume(),
+            "evictions": self.evictions,
+            "decode_ms": 1000 * self.decode_seconds / self.decoded if self.decoded else 0.0,
+        }
+
+
+# 在后台加载缩略图：查缓存用线程池，解码用进程池
+# 界面的请求优先且后到先处理，空闲时预取整个文件夹
+class ThumbnailLoader(QObject):
+    # 路径、尺寸、图片、是否为界面请求（预取时为 False）
+    thumbnail_ready = pyqtSignal(str, int, QImage, bool)
+    progress = pyqtSignal(int, int)
+    _task_done = pyqtSignal(int, object, object, str)
+
+    # 超过这个数量时丢弃较早的请求，它们已经滚出屏幕
+    MAX_PENDING = 2000
+
+    def __init__(self, cache, workers=THUMBNAIL_WORKERS, parent=None):
+        super().__init__(parent)
+        self.cache = cache
+        self.workers = workers
+        self.max_in_flight = workers * 2
+        self._process_pool = self._new_process_pool()
+        self._process_pool_lock = threading.Lock()
+        self._closed = False
+        self._io_pool = ThreadPoolExecutor(max_workers=self.max_in_flight)
+        self._generation = 0
+        self._pending = {}
+        self._prefetch = iter(())
+        self._in_flight = {}
+        self._done = 0
+        self._total = 0
+        self._identities = {}
+        self._failed = set()
+        self._task_done.connect(self._on_task_done, Qt.QueuedConnection)
+
+    # 界面当前需要的缩略图
+    def request(self, image_path, level):
+        key = (image_path, level)
+        if key in self._pending or key in self._failed or key in self._in_flight.values():
+            return
+        self._pending[key] = None
+        self._total += 1
+        if len(self._pending) > self.MAX_PENDING:
+            del self._pending[next(iter(self._pending))]
+            self._done += 1
+        self._fill()
+
+    # 没有界面请求时预取
+    def prefetch(self, image_paths, level):
+        self._prefetch = ((image_path, level) for image_path in image_paths)
+        self._fill()
+
+    # 忘记文件标识（不指定路径时全部忘记）
+    def forget_identities(self, image_paths=None):
+        if image_paths is None:
+            self._identities = {}
+            self._failed = set()
+        else:
+            for image_path in image_paths:
+                self._identities.pop(image_path, None)
+            self._failed = {key for key in self._failed if key[0] not in image_paths}
+
+    def cache_key(self, image_path, level):
+        identity = self._identities.get(image_path)
+        if identity is None:
+            identity = self._identities[image_path] = file_identity(image_path)
+        return identity + (level,)
+
+    def cancel(self):
+        self._generation += 1
+        self._pending = {}
+        self._prefetch = iter(())
+        for future in list(self._in_flight):
+            future.cancel()
+        self._done = self._total = 0
+        self.progress.emit(0, 0)
+
+    def shutdown(self):
+        self.cancel()
+        self._io_pool.shutdown(wait=False, cancel_futures=True)
+        with self._process_pool_lock:
+            self._closed = True
+            self._process_pool.shutdown(wait=False, cancel_futures=True)
+
+    def _fill(self):
+        while len(self._in_flight) < self.max_in_flight:
+            if self._pending:
+                # 最新的请求优先
+                key = self._pending.popitem()[0]
+                urgent = True
+            else:
+                key = next(self._prefetch, None)
+                if key is None:
+                    return
+                urgent = False
+            self._submit(key, urgent)
+
+    def _submit(self, key, urgent):
+        generation = self._generation
+        future = self._io_pool.submit(self._load, *key)
+        self._in_flight[future] = key
+
+        def done(future):
+            if future.cancelled():
+                self._task_done.emit(generation, future, urgent, "")
+                return
+            error = future.exception()
+            self._task_done.emit(generation, future, urgent, str(error) if error else "")
+
+        future.add_done_callback(done)
+
+    def _new_process_pool(self):
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    # 工作进程崩溃（解码器出错、被系统杀掉）后整个进程池都不能用了，重建后重试一次
+    def _generate_pyramid(self, image_path):
+        process_pool = self._process_pool
+        try:
+            return process_pool.submit(timed_thumbnail_pyramid, image_path).result()
+        except BrokenProcessPool:
+            with self._process_pool_lock:
+                # 同一批失败的任务只重建一次
+                if self._process_pool is process_pool and not self._closed:
+                    self._process_pool = self._new_process_pool()
+                    process_pool.shutdown(wait=False, cancel_futures=True)
+            return self._process_pool.submit(timed_thumbnail_pyramid, image_path).result()
+
+    def _load(self, image_path, level):
+        key = self.cache_key(image_path, level)
+        thumbnail_data = self.cache.get(key)
+        if thumbnail_data is None:
+            pyramid, seconds = self._generate_pyramid(image_path)
+            self.cache.store_pyramid(key[:-1], pyramid, seconds)
+            thumbnail_data = pyramid[level]
+        # QImage 可以在界面线程之外创建，QPixmap 不行
+        return QImage.fromData(thumbnail_data)
+
+    def _on_task_done(self, generation, future, urgent, error):
+        image_path, level = self._in_flight.pop(future)
+        if generation == self._generation and not future.cancelled():
+            if error:
+                # 进程池再次崩溃不一定是这张图片的问题，下次显示时再试
+                if not isinstance(future.exception(), BrokenProcessPool):
+                    self._failed.add((image_path, level))
+                print(f"Error generating thumbnail for {image_path}: {error}")
+            else:
+                self.thumbnail_ready.emit(image_path, level, future.result(), urgent)
+            if urgent:
+                self._done += 1
+                if self._done >= self._total and not self._pending:
+                    self._done = self._total = 0
+                self.progress.emit(self._done, self._total)
+        self._fill()
+
+
+# 图片列表模型，只为显示出来的行加载缩略图，已解码的缩略图按内存上限缓存
+class ImageListModel(QAbstractListModel):
+    PathRole = Qt.UserRole
+
+    def __init__(self, loader, level=THUMBNAIL_LEVELS[0], max_bytes=256 * 1024 * 1024, parent=None):
+        super().__init__(parent)
+        self.loader = loader
+        self.level = level
+        self.max_bytes = max_bytes
+        self.paths = []
+        self.rows = {}
+        # 合并显示的组：代表图片 -> 组内照片数
+        self.group_sizes = {}
+        self.pixmaps = OrderedDict()
+        self.pixmap_bytes = 0
+        self.placeholder = QPixmap(1, 1)
+        self.placeholder.fill(QColor(220, 220, 220))
+        loader.thumbnail_ready.connect(self.on_thumbnail_ready)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.paths)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        image_path = self.paths[index.row()]
+        if role == Qt.DisplayRole:
+            group_size = self.group_sizes.get(image_path)
+            if group_size:
+                return f"{os.path.basename(image_path)} ({group_size} 张)"
+            return os.path.basename(image_path)
+        if role == Qt.DecorationRole:
+            return self.pixmap(image_path)
+        if role == Qt.ToolTipRole or role == self.PathRole:
+            return image_path
+        return None
+
+    def pixmap(self, image_path):
+        entry = self.pixmaps.get(image_path)
+        if entry is not None:
+            self.pixmaps.move_to_end(image_path)
+            if entry[0] != self.level:
+                self.loader.request(image_path, self.level)
+            return entry[1]
+        self.loader.request(image_path, self.level)
+        return self.placeholder
+
+    def set_images(self, image_paths, group_sizes=None):
+        self.beginResetModel()
+        self.paths = list(image_paths)
+        self.group_sizes = group_sizes or {}
+        self.rows = {image_path: row for row, image_path in enumerate(self.paths)}
+        self.endResetModel()
+        self.loader.cancel()
+        self.loader.prefetch(self._iter_paths(), self.level)
+
+    def _iter_paths(self):
+        # 预取过程中追加的行也会被预取
+        row = 0
+        while row < len(self.paths):
+            yield self.paths[row]
+            row += 1
+
+    def append_images(self, image_paths):
+        if not image_paths:
+            return
+        first = len(self.paths)
+        self.beginInsertRows(QModelIndex(), first, first + len(image_paths) - 1)
+        for row, image_path in enumerate(image_paths, first):
+            self.rows[image_path] = row
+        self.paths.extend(image_paths)
+        self.endInsertRows()
+
+    def remove_images(self, image_paths):
+        rows = sorted(self.rows[path] for path in image_paths if path in self.rows)
+        if not rows:
+            return
+        if rows[-1] - rows[0] + 1 == len(rows):
+            self.beginRemoveRows(QModelIndex(), rows[0], rows[-1])
+            del self.paths[rows[0]:rows[-1] + 1]
+            self.endRemoveRows()
+        else:
+            # 分散的行（挑选后删除的照片）一次性重置，
+            # 而不是每段连续的行各删除、重新布局一次
+            removed = set(image_paths)
+            self.beginResetModel()
+            self.paths = [path for path in self.paths if path not in removed]
+            self.endResetModel()
+        self.rows = {image_path: row for row, image_path in enumerate(self.paths)}
+        self.clear_pixmaps(image_paths)
+
+    def set_level(self, level):
+        if level == self.level:
+            return
+        self.level = level
+        self.loader.cancel()
+        # 重绘可见的行，让它们请求新的尺寸
+        if self.paths:
+            self.dataChanged.emit(self.index(0), self.index(len(self.paths) - 1), [Qt.DecorationRole])
+        self.loader.prefetch(self.paths, self.level)
+
+    def clear_pixmaps(self, image_paths=None):
+        for image_path in list(self.pixmaps) if image_paths is None else image_paths:
+            entry = self.pixmaps.pop(image_path, None)
+            if entry is not None:
+                self.pixmap_bytes -= self._pixmap_size(entry[1])
+
+    @staticmethod
+    def _pixmap_size(pixmap):
+        return pixmap.width() * pixmap.height() * 4
+
+    def on_thumbnail_ready(self, image_path, level, image, urgent):
+        row = self.rows.get(image_path)
+        if row is None or level != self.level:
+            return
+        size = image.width() * image.height() * 4
+        # 预取的缩略图只占用空闲的空间，不能挤掉屏幕上的
+        if not urgent and self.pixmap_bytes + size > self.max_bytes:
+            return
+        self.clear_pixmaps([image_path])
+        self.pixmaps[image_path] = (level, QPixmap.fromImage(image))
+        self.pixmap_bytes += size
+        while self.pixmap_bytes > self.max_bytes and len(self.pixmaps) > 1:
+            _, (_, pixmap) = self.pixmaps.popitem(last=False)
+            self.pixmap_bytes -= self._pixmap_size(pixmap)
+        index = self.index(row)
+        self.dataChanged.emit(index, index, [Qt.DecorationRole])
+
+
+# EXIF 时间字符串转为时间戳，无法解析时返回 None
+def parse_exif_datetime(value, subsec=None):
+    # 有的相机把时间存成 BYTE/UNDEFINED 类型，读出来是 bytes
+    value = _text(value)
+    subsec = _text(subsec)
+    try:
+        timestamp = datetime.datetime.strptime(value[:19], "%Y:%m:%d %H:%M:%S").timestamp()
+    except (TypeError, ValueError, OverflowError):
+        return None
+    if subsec and subsec.isdigit():
+        timestamp += int(subsec) / 10 ** len(subsec)
+    return timestamp
+
+
+# 读取总量不超过 budget 字节的文件包装
+class _BoundedFile:
+    def __init__(self, f, budget=EXIF_READ_BUDGET):
+        self.f = f
+        self.budget = budget
+
+    def seek(self, offset, whence=0):
+        return self.f.seek(offset, whence)
+
+    def tell(self):
+        return self.f.tell()
+
+    def read(self, size):
+        if size > self.budget:
+            raise ValueError("header read budget exhausted")
+        data = self.f.read(size)
+        self.budget -= len(data)
+        return data
+
+
+# 元数据索引需要的标签：(IFD, tag) -> 名称
+EXIF_TAGS = {
+    ("ifd0", 0x010F): "make",
+    ("ifd0", 0x0110): "model",
+    ("ifd0", 0x0132): "datetime",
+    ("ifd0", 0x0112): "orientation",
+    ("exif", 0x9003): "datetime_original",
+    ("exif", 0x9291): "subsec_original",
+    ("exif", 0xA434): "lens",
+    ("exif", 0xA002): "width",
+    ("exif", 0xA003): "height",
+}
+
+
+# 读取一个 IFD 中需要的标签，并跟随 Exif IFD 指针
+def _read_tiff_tags(reader, ifd="ifd0", offset=None, tags=None):
+    tags = {} if tags is None else tags
+    entries, _ = reader.read_ifd(reader.first_ifd if offset is None else offset)
+    for (tag_ifd, tag), name in EXIF_TAGS.items():
+        if tag_ifd == ifd and tag in entries and name not in tags:
+            value = reader.value(entries[tag], max_bytes=256)
+            tags[name] = value[0] if isinstance(value, tuple) else value
+    if ifd == "ifd0" and 0x8769 in entries:
+        _read_tiff_tags(reader, "exif", reader.first(entries, 0x8769), tags)
+    return tags
+
+
+# 读取 JPEG 段直到帧头：EXIF 标签和像素尺寸
+def _read_jpeg_tags(f, start=0):
+    tags = {}
+    f.seek(start + 2)
+    while True:
+        marker = f.read(4)
+        if len(marker) < 4 or marker[0] != 0xFF or marker[1] in (0xD9, 0xDA):
+            return tags
+        length = struct.unpack(">H", marker[2:])[0]
+        segment_end = f.tell() + length - 2
+        if marker[1] == 0xE1 and "make" not in tags and f.read(6) == b"Exif\0\0":
+            _read_tiff_tags(TiffReader(f, f.tell()), tags=tags)
+        elif 0xC0 <= marker[1] <= 0xCF and marker[1] not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack(">HH", f.read(5)[1:])
+            tags["width"], tags["height"] = width, height
+            return tags
+        f.seek(segment_end)
+
+
+# 遍历 ISO BMFF 的 box，返回 (类型, 内容起点, 结束位置)
+def _iter_boxes(f, start, end):
+    position = start
+    while position + 8 <= end:
+        f.seek(position)
+        size, box_type = struct.unpack(">I4s", f.read(8))
+        header = 8
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+            header = 16
+        elif size == 0:
+            size = end - position
+        if size < header:
+            return
+        yield box_type, position + header, position + size
+        position += size
+
+
+CANON_CR3_UUID = bytes.fromhex("85c0b687820f11e08111f4ce462b6a48")
+
+
+# CR3 的 IFD0 在 moov/uuid/CMT1 中，Exif IFD 在 CMT2 中
+def _read_cr3_tags(f, file_size):
+    tags = {}
+    for box_type, body, end in _iter_boxes(f, 0, file_size):
+        if box_type != b"moov":
+            continue
+        for child_type, child_body, child_end in _iter_boxes(f, body, end):
+            f.seek(child_body)
+            if child_type != b"uuid" or f.read(16) != CANON_CR3_UUID:
+                continue
+            for cmt_type, cmt_body, _ in _iter_boxes(f, child_body + 16, child_end):
+                if cmt_type == b"CMT1":
+                    _read_tiff_tags(TiffReader(f, cmt_body), tags=tags)
+                elif cmt_type == b"CMT2":
+                    _read_tiff_tags(TiffReader(f, cmt_body), ifd="exif", tags=tags)
+        break
+    return tags
+
+
+# 通过 meta/iinf 和 meta/iloc 找到 HEIF/HIF 中的 Exif
+def _read_heif_tags(f, file_size):
+    for box_type, body, end in _iter_boxes(f, 0, file_size):
+        if box_type != b"meta":
+            continue
+        exif_item = None
+        locations = {}
+        # meta 是 full box：跳过 version 和 flags
+        for child_type, child_body, child_end in _iter_boxes(f, body + 4, end):
+            f.seek(child_body)
+            if child_type == b"iinf":
+                version = f.read(4)[0]
+                count_size = 2 if version == 0 else 4
+                f.read(count_size)
+                for infe_type, infe_body, _ in _iter_boxes(f, child_body + 4 + count_size, child_end):
+                    f.seek(infe_body)
+                    version = f.read(4)[0]
+                    if infe_type != b"infe" or version < 2:
+                        continue
+                    item_id = struct.unpack(">H" if version == 2 else ">I", f.read(2 if version == 2 else 4))[0]
+                    f.read(2)  # item_protection_index
+                    if f.read(4) == b"Exif":
+                        exif_item = item_id
+            elif child_type == b"iloc":
+                version = f.read(4)[0]
+                sizes = f.read(2)
+                offset_size, length_size = sizes[0] >> 4, sizes[0] & 15
+                base_offset_size, index_size = sizes[1] >> 4, (sizes[1] & 15 if version else 0)
+
+                def number(size):
+                    return int.from_bytes(f.read(size), "big") if size else 0
+
+                item_count = number(2 if version < 2 else 4)
+                for _ in range(item_count):
+                    item_id = number(2 if version < 2 else 4)
+                    if version in (1, 2):
+                        f.read(2)  # construction_method
+                    f.read(2)  # data_reference_index
+                    base_offset = number(base_offset_size)
+                    extents = []
+                    for _ in range(number(2)):
+                        number(index_size)
+                        extents.append((base_offset + number(offset_size), number(length_size)))
+                    locations[item_id] = extents
+        if exif_item is None or not locations.get(exif_item):
+            return {}
+        offset = locations[exif_item][0][0]
+        f.seek(offset)
+        tiff_header_offset = struct.unpack(">I", f.read(4))[0]
+        return _read_tiff_tags(TiffReader(f, offset + 4 + tiff_header_offset))
+    return {}
+
+
+# 只读取文件头部的 EXIF，不解码图片，读取量不超过 budget
+def read_exif_header(image_path, budget=EXIF_READ_BUDGET):
+    with open(image_path, "rb") as raw:
+        f = _BoundedFile(raw, budget)
+        head = f.read(16)
+        file_size = os.fstat(raw.fileno()).st_size
+        try:
+            if head.startswith(b"\xff\xd8"):
+                return _read_jpeg_tags(f)
+            if head[:4] in (b"II*\0", b"MM\0*", b"IIRO", b"IIRS", b"IIU\0"):
+                return _read_tiff_tags(TiffReader(f))
+            if head.startswith(b"FUJIFILMCCD-RAW"):
+                f.seek(84)
+                return _read_jpeg_tags(f, struct.unpack(">I", f.read(4))[0])
+            if head[4:8] == b"ftyp":
+                if head[8:12] == b"crx ":
+                    return _read_cr3_tags(f, file_size)
+                return _read_heif_tags(f, file_size)
+        except (struct.error, ValueError, IndexError, OSError):
+            pass
+    return {}
+
+
+def _text(value):
+    if isinstance(value, bytes):
+        value = value.decode("utf-8", "replace")
+    return value.strip("\0 ") or None if isinstance(value, str) else None
+
+
+# 元数据索引中一张图片对应的一行
+def read_image_metadata(image_path, st=None):
+    if st is None:
+        st = os.stat(image_path)
+    file_type = os.path.splitext(image_path)[1].lower()
+    tags = read_exif_header(image_path)
+    if "width" not in tags and file_type in (".png", ".gif", ".bmp", ".tif"):
+        try:
+            # Image.open 只解析文件头，这里不会解码像素
+            with Image.open(image_path) as img:
+                tags["width"], tags["height"] = img.size
+        except Exception:
+            pass
+    taken_at = parse_exif_datetime(tags.get("datetime_original"), tags.get("subsec_original"))
+    if taken_at is None:
+        taken_at = parse_exif_datetime(tags.get("datetime"))
+    return {
+        "path": image_path,
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "taken_at": st.st_mtime if taken_at is None else taken_at,
+        "make": _text(tags.get("make")),
+        "model": _text(tags.get("model")),
+        "lens": _text(tags.get("lens")),
+        "width": tags.get("width"),
+        "height": tags.get("height"),
+        "file_type": file_type,
+    }
+
+
+# 用线程池批量读取元数据，按输入顺序返回
+def read_metadata_batch(items, workers=METADATA_WORKERS):
+    def read(item):
+        try:
+            return read_image_metadata(*item)
+        except OSError:
+            # 列出之后被删除或无法读取的文件直接跳过
+            return None
+        except Exception as e:
+            print(f"Error reading metadata for {item[0]}: {e}")
+            return None
+
+    pool = ThreadPoolExecutor(max_workers=workers)
+    try:
+        for row in pool.map(read, items):
+            if row is not None:
+                yield row
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+# SQLite 元数据索引，筛选和排序都是查询；每个线程需要单独的实例
+class MetadataIndex:
+    COLUMNS = ("path", "size", "mtime_ns", "taken_at", "make", "model", "lens",
+               "width", "height", "file_type")
+
+    def __init__(self, db_path):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.db = sqlite3.connect(db_path, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS images (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                taken_at REAL,
+                make TEXT,
+                model TEXT,
+                lens TEXT,
+                width INTEGER,
+                height INTEGER,
+                file_type TEXT
+            );
+            CREATE INDEX IF NOT EXISTS images_taken_at ON images (taken_at);
+            CREATE INDEX IF NOT EXISTS images_model ON images (model, taken_at);
+            CREATE INDEX IF NOT EXISTS images_file_type ON images (file_type, taken_at);
+        """)
+
+    def close(self):
+        self.db.close()
+
+    @staticmethod
+    def _folder_range(folder):
+        prefix = os.path.join(folder, "")
+        return prefix, prefix + "\U0010ffff"
+
+    # 文件夹下所有已索引文件的 {路径: (大小, 修改时间)}
+    def file_states(self, folder):
+        rows = self.db.execute(
+            "SELECT path, size, mtime_ns FROM images WHERE path >= ? AND path < ?",
+            self._folder_range(folder),
+        )
+        return {path: (size, mtime_ns) for path, size, mtime_ns in rows}
+
+    def upsert(self, rows):
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO images (%s) VALUES (%s)"
+                % (", ".join(self.COLUMNS), ", ".join("?" * len(self.COLUMNS))),
+                [tuple(row[column] for column in self.COLUMNS) for row in rows],
+            )
+
+    def remove(self, paths):
+        with self.db:
+            self.db.executemany("DELETE FROM images WHERE path = ?", [(path,) for path in paths])
+
+    # 文件夹下符合条件的路径，参数为 None 表示不筛选；ascending 为 None 时按路径排序
+    def query(self, folder, start=None, end=None, model=None, file_type=None, ascending=None):
+        sql = "SELECT path FROM images WHERE path >= ? AND path < ?"
+        args = list(self._folder_range(folder))
+        if start is not None:
+            sql += " AND taken_at >= ?"
+            args.append(start)
+        if end is not None:
+            sql += " AND taken_at < ?"
+            args.append(end)
+        if model is not None:
+            # 空字符串表示没有相机型号的图片
+            sql += " AND model IS ?"
+            args.append(model or None)
+        if file_type is not None:
+            sql += " AND file_type = ?"
+            args.append(file_type)
+        if ascending is None:
+            sql += " ORDER BY path"
+        else:
+            sql += " ORDER BY taken_at %s, path" % ("ASC" if ascending else "DESC")
+        return [path for (path,) in self.db.execute(sql, args)]
+
+    # 文件夹下所有已索引文件的 {路径: 拍摄时间}
+    def capture_times(self, folder):
+        rows = self.db.execute(
+            "SELECT path, taken_at FROM images WHERE path >= ? AND path < ?",
+            self._folder_range(folder),
+        )
+        return dict(rows)
+
+    def distinct(self, column, folder):
+        if column not in ("model", "file_type", "make", "lens"):
+            raise ValueError(column)
+        rows = self.db.execute(
+            "SELECT DISTINCT %s FROM images WHERE path >= ? AND path < ? ORDER BY 1" % column,
+            self._folder_range(folder),
+        )
+        return [value for (value,) in rows]
+
+
+# 在后台扫描文件夹，分批把图片发给界面
+class FolderScanner(QThread):
+    batch_found = pyqtSignal(list, list)
+
+    def __init__(self, folder, parent=None):
+        super().__init__(parent)
+        self.folder = folder
+
+    def run(self):
+        for directories, image_paths in iter_image_batches(self.folder, self.isInterruptionRequested):
+            self.batch_found.emit(directories, image_paths)
+
+
+# 在后台执行一批文件操作，每项为 (kind, path, target, identity)：
+# trash 移到回收站，restore 从回收站恢复，delete 永久删除，
+# purge 永久删除回收站中的文件或文件夹，prune 删除空目录
+class FileMover(QThread):
+    progress = pyqtSignal(int, int)
+
+    def __init__(self, operations, cache, parent=None):
+        super().__init__(parent)
+        self.operations = operations
+        self.cache = cache
+        self.done = []
+        self.failures = []
+
+    @staticmethod
+    def move(source, target):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            os.rename(source, target)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            shutil.move(source, target)
+
+    def run(self):
+        evicted = []
+        total = len(self.operations)
+        for done, (kind, path, target, identity) in enumerate(self.operations, 1):
+            try:
+                if kind == "trash":
+                    identity = file_identity(path)
+                    self.move(path, target)
+                elif kind == "restore":
+                    self.move(target, path)
+                elif kind == "delete":
+                    identity = file_identity(path)
+                    os.remove(path)
+                elif kind == "prune":
+                    for root, _, _ in sorted(os.walk(target), reverse=True):
+                        try:
+                            os.rmdir(root)
+                        except OSError:
+                            pass
+                elif kind == "purge":
+                    if os.path.isdir(target):
+                        shutil.rmtree(target)
+                    elif os.path.exists(target):
+                        os.remove(target)
+                if kind in ("delete", "purge") and identity is not None:
+                    evicted.append(identity)
+                self.done.append((kind, path, target, identity))
+            except OSError as e:
+                self.failures.append((path, str(e)))
+            if done % 100 == 0 or done == total:
+                self.progress.emit(done, total)
+        if evicted:
+            with self.cache.transact():
+                for identity in evicted:
+                    for level in THUMBNAIL_LEVELS + (HASH_KEY,):
+                        self.cache.delete(identity + (level,))
+
+
+# 重新读取大小或修改时间有变化的文件；prune 时删除已不存在的文件
+def update_metadata_index(index, folder, image_paths, prune=True, workers=METADATA_WORKERS,
+                          progress=None, stop=None):
+    known = index.file_states(folder)
+    stale = []
+    for image_path in image_paths:
+        try:
+            st = os.stat(image_path)
+        except OSError:
+            continue
+        if known.pop(image_path, None) != (st.st_size, st.st_mtime_ns):
+            stale.append((image_path, st))
+    if prune:
+        index.remove(known)
+
+    total = len(stale)
+    if progress is not None:
+        progress(0, total)
+    rows = read_metadata_batch(stale, workers)
+    written = 0
+    try:
+        batch = []
+        for row in rows:
+            if stop is not None and stop():
+                break
+            batch.append(row)
+            if len(batch) >= 200:
+                index.upsert(batch)
+                written += len(batch)
+                batch = []
+                if progress is not None:
+                    progress(written, total)
+        index.upsert(batch)
+        written += len(batch)
+    finally:
+        rows.close()
+    if progress is not None:
+        progress(total, total)
+    return written
+
+
+# 为缓存中没有的图片生成缩略图，返回 (命中数, 生成数, 失败列表)
+def warm_thumbnail_cache(cache, image_paths, workers=THUMBNAIL_WORKERS, progress=None, stop=None):
+    hits = generated = 0
+    failures = []
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = {}
+        for image_path in image_paths:
+            try:
+                identity = file_identity(image_path)
+            except OSError as e:
+                failures.append((image_path, str(e)))
+                continue
+            if all(identity + (level,) in cache for level in THUMBNAIL_LEVELS):
+                hits += 1
+                continue
+            futures[pool.submit(timed_thumbnail_pyramid, image_path)] = identity
+        for done, future in enumerate(as_completed(futures), 1):
+            if stop is not None and stop():
+                for pending in futures:
+                    pending.cancel()
+                break
+            identity = futures[future]
+            try:
+                pyramid, seconds = future.result()
+            except Exception as e:
+                failures.append((identity[0], str(e)))
+                continue
+            cache.store_pyramid(identity, pyramid, seconds)
+            generated += 1
+            if progress is not None:
+                progress(done, len(futures))
+    return hits, generated, failures
+
+
+# 从缩略图缓存读取 dHash，没有缩略图的先生成
+def image_hashes(cache, image_paths, workers=THUMBNAIL_WORKERS, progress=None, stop=None):
+    hashes = {}
+    identities = {}
+    for image_path in image_paths:
+        try:
+            identities[image_path] = identity = file_identity(image_path)
+        except OSError:
+            continue
+        value = cache.image_hash(identity)
+        if value is not None:
+            hashes[image_path] = value
+    missing = [image_path for image_path in identities if image_path not in hashes]
+    if missing:
+        warm_thumbnail_cache(cache, missing, workers, progress, stop)
+        for image_path in missing:
+            value = cache.image_hash(identities[image_path])
+            if value is not None:
+                hashes[image_path] = value
+    return hashes
+
+
+# 拍摄时间相差不超过 window 秒且哈希距离不超过 max_distance 的照片连成一组
+# 返回每张照片的组标签
+def group_similar(taken_at, hashes, max_distance=HASH_DISTANCE, window=BURST_WINDOW_SECONDS):
+    count = len(hashes)
+    order = np.argsort(np.asarray(taken_at, dtype=np.float64), kind="stable")
+    times = np.asarray(taken_at, dtype=np.float64)[order]
+    values = np.asarray(hashes, dtype=np.uint64)[order]
+    labels = np.arange(count)
+    if count < 2:
+        return labels
+
+    # 按时间排序后，每张照片只需和后面几张比较
+    reach = np.searchsorted(times, times + window, side="right") - np.arange(count) - 1
+    first, second = [], []
+    for offset in range(1, min(int(reach.max()), BURST_MAX_NEIGHBORS) + 1):
+        differing = (values[:-offset] ^ values[offset:]).view(np.uint8).reshape(-1, 8)
+        distance = np.unpackbits(differing, axis=1).sum(axis=1)
+        linked = np.flatnonzero((distance <= max_distance) & (reach[:-offset] >= offset))
+        first.append(linked)
+        second.append(linked + offset)
+    if not first:
+        # 没有任何两张照片的拍摄时间足够接近
+        return labels
+    first = np.concatenate(first)
+    second = np.concatenate(second)
+
+    # 连通分量：沿相似关系传播最小的标签，
+    # 并做指针跳跃，直到不再变化
+    while True:
+        smallest = np.minimum(labels[first], labels[second])
+        updated = labels.copy()
+        np.minimum.at(updated, first, smallest)
+        np.minimum.at(updated, second, smallest)
+        updated = updated[updated]
+        if np.array_equal(updated, labels):
+            break
+        labels = updated
+    result = np.empty(count, dtype=labels.dtype)
+    result[order] = labels
+    return result
+
+
+# 在后台更新元数据索引
+class MetadataIndexer(QThread):
+    progress = pyqtSignal(int, int)
+
+    def __init__(self, db_path, folder, image_paths, prune=True, parent=None):
+        super().__init__(parent)
+        self.db_path = db_path
+        self.folder = folder
+        self.image_paths = list(image_paths)
+        self.prune = prune
+
+    def run(self):
+        index = MetadataIndex(self.db_path)
+        try:
+            update_metadata_index(
+                index, self.folder, self.image_paths, self.prune,
+                progress=self.progress.emit, stop=self.isInterruptionRequested,
+            )
+        finally:
+            index.close()
+
+
+# 在后台为连拍和相似照片分组，groups 为 路径 -> 组标签
+class BurstGrouper(QThread):
+    progress = pyqtSignal(int, int)
+
+    def __init__(self, cache, db_path, folder, image_paths, parent=None):
+        super().__init__(parent)
+        self.cache = cache
+        self.db_path = db_path
+        self.folder = folder
+        self.image_paths = list(image_paths)
+        self.groups = {}
+
+    def run(self):
+        hashes = image_hashes(
+            self.cache, self.image_paths, progress=self.progress.emit, stop=self.isInterruptionRequested
+        )
+        if self.isInterruptionRequested():
+            return
+        index = MetadataIndex(self.db_path)
+        try:
+            capture_times = index.capture_times(self.folder)
+        finally:
+            index.close()
+        paths = []
+        taken_at = []
+        for image_path in hashes:
+            timestamp = capture_times.get(image_path)
+            if timestamp is None:
+                try:
+                    timestamp = os.stat(image_path).st_mtime
+                except OSError:
+                    continue
+            paths.append(image_path)
+            taken_at.append(timestamp)
+        labels = group_similar(taken_at, [hashes[image_path] for image_path in paths])
+        self.groups = dict(zip(paths, labels.tolist()))
+
+
+# 文件的 blake2b 摘要
+def file_digest(path, chunk_size=INGEST_CHUNK_BYTES):
+    digest = hashlib.blake2b(digest_size=32)
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            count = f.readinto(buffer)
+            if not count:
+                break
+            digest.update(view[:count])
+    return digest.hexdigest()
+
+
+# 复制的同时计算哈希，先写入 .part 文件，落盘并校验后再改名
+def copy_with_digest(source, target, chunk_size=INGEST_CHUNK_BYTES):
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    partial = target + ".part"
+    digest = hashlib.blake2b(digest_size=32)
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    try:
+        with open(source, "rb", buffering=0) as src, open(partial, "wb") as dst:
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(src.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            while True:
+                count = src.readinto(buffer)
+                if not count:
+                    break
+                digest.update(view[:count])
+                dst.write(view[:count])
+            dst.flush()
+            os.fsync(dst.fileno())
+            if hasattr(os, "posix_fadvise"):
+                # 丢弃页缓存，校验时从存储设备重新读取，而不是读内存中刚写入的数据
+                os.posix_fadvise(dst.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+        if file_digest(partial, chunk_size) != digest.hexdigest():
+            raise OSError(errno.EIO, "复制后校验不一致", target)
+        shutil.copystat(source, partial)
+        os.replace(partial, target)
+    except BaseException:
+        try:
+            os.remove(partial)
+        except OSError:
+            pass
+        raise
+    return digest.hexdigest()
+
+
+def load_manifest(destination):
+    try:
+        with open(os.path.join(destination, INGEST_MANIFEST), encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        # 清单条目可以从文件本身重建，只是更慢
+        return {"files": {}}
+
+
+def save_manifest(destination, manifest):
+    path = os.path.join(destination, INGEST_MANIFEST)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(path + ".tmp", path)
+
+
+# 目标已有相同文件时跳过（清单中大小和修改时间一致，或哈希一致），返回 (是否复制, 清单条目)
+def ingest_file(source, target, entry):
+    st = os.stat(source)
+    record = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "source": source}
+    try:
+        target_size = os.path.getsize(target)
+    except FileNotFoundError:
+        target_size = None
+    if target_size is not None:
+        if target_size != st.st_size:
+            raise OSError(errno.EEXIST, "目标文件已存在且内容不同", target)
+        if entry and entry.get("size") == st.st_size and entry.get("mtime_ns") == st.st_mtime_ns:
+            return False, entry
+        digest = file_digest(source)
+        if digest != file_digest(target):
+            raise OSError(errno.EEXIST, "目标文件已存在且内容不同", target)
+        return False, dict(record, blake2b=digest)
+    digest = copy_with_digest(source, target)
+    return True, dict(record, blake2b=digest, ingested_at=datetime.datetime.now().isoformat(timespec="seconds"))
+
+
+def manifest_key(source, source_root):
+    return os.path.relpath(source, source_root).replace(os.sep, "/")
+
+
+# 一组文件（如 RAW+JPEG）一起导入，任一失败就删除本组已复制的文件
+def ingest_unit(sources, source_root, destination, entries):
+    results = []
+    for source in sources:
+        key = manifest_key(source, source_root)
+        target = os.path.join(destination, *key.split("/"))
+        try:
+            copied, entry = ingest_file(source, target, entries.get(key))
+        except OSError as e:
+            for done_key, was_copied, _ in results:
+                if was_copied:
+                    try:
+                        os.remove(os.path.join(destination, *done_key.split("/")))
+                    except OSError:
+                        pass
+            return [], (source, str(e))
+        results.append((key, copied, entry))
+    return results, None
+
+
+# 把各组文件复制到 destination 下相同的相对路径并更新清单
+# 返回 (复制数, 跳过数, 复制字节数, 失败列表)
+def ingest(units, source_root, destination, workers=INGEST_WORKERS, progress=None, stop=None):
+    os.makedirs(destination, exist_ok=True)
+    manifest = load_manifest(destination)
+    files = manifest.setdefault("files", {})
+    copied = skipped = copied_bytes = done = 0
+    failures = []
+    total = sum(len(unit) for unit in units)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for unit in units:
+            entries = {key: files.get(key) for key in (manifest_key(path, source_root) for path in unit)}
+            futures[pool.submit(ingest_unit, unit, source_root, destination, entries)] = unit
+        for finished, future in enumerate(as_completed(futures), 1):
+            if stop is not None and stop():
+                for pending in futures:
+                    pending.cancel()
+                break
+            results, failure = future.result()
+            if failure is not None:
+                failures.append(failure)
+            for key, was_copied, entry in results:
+                files[key] = entry
+                if was_copied:
+                    copied += 1
+                    copied_bytes += entry["size"]
+                else:
+                    skipped += 1
+            done += len(futures[future])
+            if progress is not None:
+                progress(done, total)
+            if finished % INGEST_SAVE_EVERY == 0:
+                save_manifest(destination, manifest)
+    save_manifest(destination, manifest)
+    return copied, skipped, copied_bytes, failures
+
+
+# 在后台导入
+class Ingester(QThread):
+    progress = pyqtSignal(int, int)
+
+    def __init__(self, units, source_root, destination, parent=None):
+        super().__init__(parent)
+        self.units = units
+        self.source_root = source_root
+        self.destination = destination
+        self.result = (0, 0, 0, [])
+        self.seconds = 0.0
+        self.error = None
+
+    def run(self):
+        started = time.perf_counter()
+        try:
+            self.result = ingest(
+                self.units, self.source_root, self.destination,
+                progress=self.progress.emit, stop=self.isInterruptionRequested,
+            )
+        except OSError as e:
+            self.error = str(e)
+        self.seconds = time.perf_counter() - started
+
+
+# EXIF 方向 -> 还原方向所需的变换
+ORIENTATION_TRANSPOSES = {
+    2: (Image.FLIP_LEFT_RIGHT,),
+    3: (Image.ROTATE_180,),
+    4: (Image.FLIP_TOP_BOTTOM,),
+    5: (Image.TRANSPOSE,),
+    6: (Image.ROTATE_270,),
+    7: (Image.TRANSVERSE,),
+    8: (Image.ROTATE_90,),
+}
+
+
+# 复制为独立的 QImage，可在任何线程中使用
+def pil_to_qimage(image):
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    width, height = image.size
+    data = image.tobytes("raw", "RGB")
+    return QImage(data, width, height, width * 3, QImage.Format_RGB888).copy()
+
+
+# 解码为不超过 size 的大图并按 EXIF 方向旋转
+def decode_preview(image_path, size):
+    image = extract_thumbnail(image_path, size)
+    for method in ORIENTATION_TRANSPOSES.get(read_exif_header(image_path).get("orientation"), ()):
+        image = image.transpose(method)
+    return pil_to_qimage(image)
+
+
+# 在线程池中解码大图预览：先快速预览再完整尺寸，并预取前后几张，结果按内存上限缓存
+class PreviewLoader(QObject):
+    # 路径、图片、是否为完整尺寸（快速预览时为 False）
+    image_ready = pyqtSignal(str, QImage, bool)
+    _decoded = pyqtSignal(object, str, int, object, bool, str)
+
+    def __init__(self, workers=PREVIEW_WORKERS, max_bytes=PREVIEW_CACHE_BYTES, parent=None):
+        super().__init__(parent)
+        self.max_bytes = max_bytes
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        self._images = OrderedDict()
+        self._bytes = 0
+        self._futures = {}
+        self._decoded.connect(self._on_decoded, Qt.QueuedConnection)
+
+    def cached(self, image_path, size):
+        entry = self._images.get(image_path)
+        if entry is None or entry[0] < size:
+            return None
+        self._images.move_to_end(image_path)
+        return entry[1]
+
+    def request(self, image_path, size, neighbors=()):
+        wanted = set(neighbors)
+        wanted.add(image_path)
+        # 取消已离开窗口的图片尚未开始的解码，包括快速预览
+        for path, futures in list(self._futures.items()):
+            if path in wanted:
+                continue
+            for final, future in list(futures.items()):
+                if future.cancel():
+                    del futures[final]
+            if not futures:
+                del self._futures[path]
+
+        image = self.cached(image_path, size)
+        if image is not None:
+            self.image_ready.emit(image_path, image, True)
+        elif True not in self._futures.get(image_path, {}):
+            self._submit(image_path, min(size, PREVIEW_QUICK_SIZE), False)
+            self._submit(image_path, size, True)
+        for path in neighbors:
+            if True not in self._futures.get(path, {}) and self.cached(path, size) is None:
+                self._submit(path, size, True)
+
+    def forget(self, image_paths):
+        for image_path in image_paths:
+            entry = self._images.pop(image_path, None)
+            if entry is not None:
+                self._bytes -= entry[1].sizeInBytes()
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, image_path, size, final):
+        future = self._pool.submit(decode_preview, image_path, size)
+        self._futures.setdefault(image_path, {})[final] = future
+
+        def done(future):
+            if future.cancelled():
+                return
+            error = future.exception()
+            self._decoded.emit(future, image_path, size, None if error else future.result(), final,
+                               str(error) if error else "")
+
+        future.add_done_callback(done)
+
+    def _on_decoded(self, future, image_path, size, image, final, error):
+        futures = self._futures.get(image_path, {})
+        if futures.get(final) is future:
+            del futures[final]
+            if not futures:
+                del self._futures[image_path]
+        if image is None:
+            print(f"Error decoding preview for {image_path}: {error}")
+            return
+        if final:
+            self.forget([image_path])
+            self._images[image_path] = (size, image)
+            self._bytes += image.sizeInBytes()
+            while self._bytes > self.max_bytes and len(self._images) > 1:
+                _, (_, evicted) = self._images.popitem(last=False)
+                self._bytes -= evicted.sizeInBytes()
+        self.image_ready.emit(image_path, image, final)
+
+
+# 大图预览：方向键切换，空格或 Esc 返回
+class PreviewPane(QWidget):
+    navigate = pyqtSignal(int)
+    closed = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setFocusPolicy(Qt.StrongFocus)
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.setLayout(layout)
+        self.image_label = QLabel()
+        self.image_label.setAlignment(Qt.AlignCenter)
+        self.image_label.setMinimumSize(1, 1)
+        self.image_label.setStyleSheet("background-color: #202020;")
+        layout.addWidget(self.image_label, 1)
+        self.caption = QLabel()
+        self.caption.setAlignment(Qt.AlignCenter)
+        layout.addWidget(self.caption)
+        self.pixmap = QPixmap()
+
+    def set_image(self, pixmap, caption):
+        self.pixmap = pixmap
+        self.caption.setText(caption)
+        self.update_scaled()
+
+    def update_scaled(self):
+        if self.pixmap.isNull():
+            self.image_label.clear()
+            return
+        size = self.image_label.size() * self.devicePixelRatioF()
+        scaled = self.pixmap.scaled(size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        scaled.setDevicePixelRatio(self.devicePixelRatioF())
+        self.image_label.setPixmap(scaled)
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.update_scaled()
+
+    def keyPressEvent(self, event):
+        if event.key() in (Qt.Key_Left, Qt.Key_Up):
+            self.navigate.emit(-1)
+        elif event.key() in (Qt.Key_Right, Qt.Key_Down):
+            self.navigate.emit(1)
+        elif event.key() in (Qt.Key_Space, Qt.Key_Escape):
+            self.closed.emit()
+        else:
+            super().keyPressEvent(event)
+
+    def mouseDoubleClickEvent(self, event):
+        self.closed.emit()
 
 
 class App(QMainWindow):
@@ -24,9 +1859,10 @@ class App(QMainWindow):
 
         self.setWindowTitle("SD卡照片快速查看器")
         self.setGeometry(100, 100, 1200, 800)
-        self.root_folder = os.path.dirname(os.path.abspath(__file__))
+        self.root_folder = APP_FOLDER
         self.current_folder = self.root_folder
-        self.images = self.create_image_list()
+        self.all_images = []
+        self.images = self.all_images
 
         main_widget = QWidget()
         self.setCentralWidget(main_widget)
@@ -34,19 +1870,95 @@ class App(QMainWindow):
         layout = QHBoxLayout()
         main_widget.setLayout(layout)
 
-        self.image_list = QListWidget()
-        self.image_list.setViewMode(QListWidget.IconMode)
-        self.image_list.setIconSize(QSize(100, 100))
-        self.image_list.setResizeMode(QListWidget.Adjust)
-        self.image_list.setSelectionMode(QListWidget.ExtendedSelection)
+        # 创建缓存
+        self.cache = ThumbnailCache(THUMBNAIL_CACHE_FOLDER)
+        self.cache.namespace = volume_namespace(self.current_folder)
+        # 定期淘汰过期和超出容量的缩略图，并在状态栏显示缓存统计
+        self.cache_timer = QTimer(self)
+        self.cache_timer.timeout.connect(self.update_cache_stats)
+        self.cache_timer.start(2000)
+        self.cache_maintenance_timer = QTimer(self)
+        self.cache_maintenance_timer.timeout.connect(self.cache.maintain)
+        self.cache_maintenance_timer.start(60 * 1000)
+
+        # 后台缩略图加载
+        self.thumbnail_loader = ThumbnailLoader(self.cache, parent=self)
+        self.thumbnail_loader.progress.connect(self.on_thumbnail_progress)
+
+        # 虚拟化列表：只为可见的行生成图标
         self.thumbnail_size = QSize(100, 100)
-        self.image_list.setIconSize(self.thumbnail_size)
+        self.image_model = ImageListModel(
+            self.thumbnail_loader, thumbnail_level(self.thumbnail_size.width()), parent=self
+        )
+        self.image_list = QListView()
+        self.image_list.setModel(self.image_model)
+        self.image_list.setViewMode(QListView.IconMode)
+        self.image_list.setResizeMode(QListView.Adjust)
+        self.image_list.setLayoutMode(QListView.Batched)
+        self.image_list.setUniformItemSizes(True)
+        self.image_list.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.image_list.setTextElideMode(Qt.ElideMiddle)
         self.image_list.viewport().grabGesture(Qt.PinchGesture)
+        self.apply_icon_size()
+
+        # 缩放结束后再从缓存加载对应尺寸的缩略图
+        self.zoom_timer = QTimer(self)
+        self.zoom_timer.setSingleShot(True)
+        self.zoom_timer.setInterval(200)
+        self.zoom_timer.timeout.connect(self.refresh_thumbnails)
+
+        # 流式扫描，扫描完成后监视目录变化并增量更新
+        self.folder_scanner = None
+        self.subfolder_scanners = []
+        self.file_mover = None
+        self.moving_paths = set()
+        self.ingester = None
+        self.ingest_destination = None
+        self.trash_batches = []
+        self.directory_images = {}
+        self.changed_directories = set()
+        self.folder_watcher = QFileSystemWatcher(self)
+        self.folder_watcher.directoryChanged.connect(self.on_directory_changed)
+        self.watch_timer = QTimer(self)
+        self.watch_timer.setSingleShot(True)
+        self.watch_timer.setInterval(300)
+        self.watch_timer.timeout.connect(self.apply_directory_changes)
+
+        # 检测新插入的存储卡
+        self.known_volumes = mounted_volumes()
+        self.volume_watcher = QFileSystemWatcher(volume_roots(), self)
+        self.volume_watcher.directoryChanged.connect(self.check_volumes)
+        if sys.platform == "win32":
+            self.volume_timer = QTimer(self)
+            self.volume_timer.timeout.connect(self.check_volumes)
+            self.volume_timer.start(3000)
+
+        # 元数据索引，日期/相机/文件类型筛选和排序都是查询
+        self.index_path = METADATA_INDEX_PATH
+        self.metadata_index = MetadataIndex(self.index_path)
+        self.metadata_indexer = None
+        self.pending_index_paths = set()
+        # 连拍/相似照片分组：路径 -> 组标签
+        self.burst_grouper = None
+        self.burst_groups = {}
+        self.date_filter = None
+        self.sort_ascending = None
+        self.image_set = set()
         
-        # 创建缓存
-        self.cache = Cache(os.path.join(self.root_folder, ".thumbnails"))
-        
-        layout.addWidget(self.image_list)
+        # 网格和大图预览共用一个位置，双击或空格切换
+        self.preview_loader = PreviewLoader(parent=self)
+        self.preview_loader.image_ready.connect(self.on_preview_ready)
+        self.preview_pane = PreviewPane()
+        self.preview_pane.navigate.connect(self.move_preview)
+        self.preview_pane.closed.connect(self.close_preview)
+        self.preview_path = None
+        self.preview_final = False
+        self.image_list.doubleClicked.connect(lambda index: self.open_preview(index.row()))
+        self.image_list.installEventFilter(self)
+        self.view_stack = QStackedWidget()
+        self.view_stack.addWidget(self.image_list)
+        self.view_stack.addWidget(self.preview_pane)
+        layout.addWidget(self.view_stack)
 
         buttons_widget = QWidget()
         buttons_layout = QVBoxLayout()
@@ -100,8 +2012,19 @@ class App(QMainWindow):
         cancel_date_filter_button = QPushButton("取消日期筛选")
         buttons_layout.addWidget(cancel_date_filter_button)
         cancel_date_filter_button.clicked.connect(self.cancel_date_filter)
-        
-        self.image_list.itemSelectionChanged.connect(self.on_selection_changed)
+
+        filter_layout = QGridLayout()
+        buttons_layout.addLayout(filter_layout)
+
+        filter_layout.addWidget(QLabel("相机:"), 0, 0)
+        self.camera_combo = QComboBox()
+        filter_layout.addWidget(self.camera_combo, 0, 1)
+
+        filter_layout.addWidget(QLabel("文件类型:"), 1, 0)
+        self.file_type_combo = QComboBox()
+        filter_layout.addWidget(self.file_type_combo, 1, 1)
+
+        self.image_list.selectionModel().selectionChanged.connect(self.on_selection_changed)
 
         ascending_button = QPushButton("升序")
         buttons_layout.addWidget(ascending_button)
@@ -110,11 +2033,40 @@ class App(QMainWindow):
         descending_button = QPushButton("降序")
         buttons_layout.addWidget(descending_button)
         descending_button.clicked.connect(lambda: self.sort_images(ascending=False))
+
+        default_order_button = QPushButton("默认顺序")
+        buttons_layout.addWidget(default_order_button)
+        default_order_button.clicked.connect(lambda: self.sort_images(ascending=None))
         
         delete_button = QPushButton("删除选中照片")
         buttons_layout.addWidget(delete_button)
         delete_button.clicked.connect(self.delete_images)
 
+        self.use_trash_checkbox = QCheckBox("移到回收站（可撤销）")
+        self.use_trash_checkbox.setChecked(True)
+        buttons_layout.addWidget(self.use_trash_checkbox)
+
+        self.delete_pairs_checkbox = QCheckBox("同时删除 RAW+JPEG 配对文件")
+        buttons_layout.addWidget(self.delete_pairs_checkbox)
+
+        self.collapse_bursts_checkbox = QCheckBox("合并连拍和相似照片")
+        buttons_layout.addWidget(self.collapse_bursts_checkbox)
+        self.collapse_bursts_checkbox.toggled.connect(self.toggle_burst_grouping)
+
+        self.undo_delete_button = QPushButton("撤销删除")
+        self.undo_delete_button.setEnabled(False)
+        buttons_layout.addWidget(self.undo_delete_button)
+        self.undo_delete_button.clicked.connect(self.undo_delete)
+
+        empty_trash_button = QPushButton("清空回收站")
+        buttons_layout.addWidget(empty_trash_button)
+        empty_trash_button.clicked.connect(self.empty_trash)
+
+        ingest_button = QPushButton("导入照片")
+        ingest_button.setToolTip("把选中的照片（未选中时为当前筛选结果）连同 RAW+JPEG 配对文件复制到其他文件夹")
+        buttons_layout.addWidget(ingest_button)
+        ingest_button.clicked.connect(self.ingest_images)
+
         select_all_button = QPushButton("全选")
         buttons_layout.addWidget(select_all_button)
         select_all_button.clicked.connect(self.select_all_images)
@@ -126,12 +2078,22 @@ class App(QMainWindow):
         buttons_layout.addStretch()
 
         self.statusBar()
+        self.cache_stats_label = QLabel()
+        self.statusBar().addPermanentWidget(self.cache_stats_label)
 
-        self.load_images()
+        self.update_filter_options()
+        self.camera_combo.currentIndexChanged.connect(self.apply_filters)
+        self.file_type_combo.currentIndexChanged.connect(self.apply_filters)
+
+        self.start_scan()
         
         clear_cache_button = QPushButton("清理缩略图缓存")
         buttons_layout.addWidget(clear_cache_button)
         clear_cache_button.clicked.connect(self.clear_thumbnail_cache)
+
+        clear_card_cache_button = QPushButton("清理当前存储卡缓存")
+        buttons_layout.addWidget(clear_card_cache_button)
+        clear_card_cache_button.clicked.connect(self.clear_card_thumbnail_cache)
         
         zoom_in_button = QPushButton("+")
         buttons_layout.addWidget(zoom_in_button)
@@ -141,97 +2103,373 @@ class App(QMainWindow):
         buttons_layout.addWidget(zoom_out_button)
         zoom_out_button.clicked.connect(self.zoom_out)
         
-    def on_selection_changed(self):
-        for index in range(self.image_list.count()):
-            item = self.image_list.item(index)
-            item.setCheckState(Qt.Checked if item.isSelected() else Qt.Unchecked)
+    def on_selection_changed(self, *args):
+        # 按选择区间计数，与选中的行数无关
+        count = sum(r.height() for r in self.image_list.selectionModel().selection())
+        self.statusBar().showMessage(f"已选择 {count} 张照片" if count else "")
 
     def sort_images(self, ascending=True):
-        self.image_list.setSortingEnabled(True)
-        self.image_list.sortItems(Qt.AscendingOrder if ascending else Qt.DescendingOrder)
-
-    def create_image_list(self):
-        image_list = []
-        for root, dirs, files in os.walk(self.current_folder):
-            for file in files:
-                if file.lower().endswith((".png", ".jpg", ".jpeg", ".gif", ".bmp", ".3fr", ".ari", ".arw", ".bay", 
-                                        ".cap", ".cr2", ".cr3", ".crw", ".dcr", ".dcs", ".dng", ".drf", ".eip", 
-                                        ".erf", ".fff", ".gpr", ".iiq", ".k25", ".kdc", ".mdc", ".mef", ".mos", 
-                                        ".mrw", ".nef", ".nrw", ".orf", ".pef", ".ptx", ".pxn", ".r3d", ".raf", 
-                                        ".raw", ".rwl", ".rw2", ".rwz", ".sr2", ".srf", ".srw", ".tif", ".x3f",".HIF")):
-                    image_list.append(os.path.join(root, file))
-        return image_list
+        # 按拍摄时间排序
+        self.sort_ascending = ascending
+        self.apply_filters()
+
+    def start_scan(self):
+        self.stop_thread(self.folder_scanner)
+        for scanner in list(self.subfolder_scanners):
+            self.stop_thread(scanner)
+        self.stop_thread(self.burst_grouper)
+        self.burst_groups = {}
+        self.all_images = []
+        self.directory_images = {}
+        self.changed_directories.clear()
+        if self.folder_watcher.directories():
+            self.folder_watcher.removePaths(self.folder_watcher.directories())
+        # 有筛选条件时，扫描期间直接显示索引中的结果
+        self.update_filter_options()
+        self.apply_filters()
+        self.folder_scanner = FolderScanner(self.current_folder, parent=self)
+        self.folder_scanner.batch_found.connect(self.on_scan_batch)
+        self.folder_scanner.finished.connect(self.on_scan_finished)
+        self.folder_scanner.start()
+
+    def stop_thread(self, thread):
+        if thread is not None:
+            thread.requestInterruption()
+            thread.wait()
+
+    def on_scan_batch(self, directories, image_paths):
+        if self.sender() is not self.folder_scanner:
+            return
+        for directory in directories:
+            self.directory_images.setdefault(directory, set())
+        for image_path in image_paths:
+            self.directory_images.setdefault(os.path.dirname(image_path), set()).add(image_path)
+        self.all_images.extend(image_paths)
+        if not self.filters_active():
+            if self.sort_ascending is not None:
+                # 尚未索引的文件按扫描顺序排在后面
+                image_paths = [path for path in image_paths if path not in self.image_set]
+                self.image_set.update(image_paths)
+                self.images.extend(image_paths)
+            self.image_model.append_images(image_paths)
+        self.statusBar().showMessage(f"正在扫描，已找到 {len(self.all_images)} 张照片")
+
+    def on_scan_finished(self):
+        if self.sender() is not self.folder_scanner or self.folder_scanner.isInterruptionRequested():
+            return
+        self.statusBar().showMessage(f"共 {len(self.all_images)} 张照片", 5000)
+        directories = list(self.directory_images)[:MAX_WATCHED_DIRECTORIES]
+        if directories:
+            self.folder_watcher.addPaths(directories)
+        self.start_indexing()
+
+    def on_directory_changed(self, directory):
+        self.changed_directories.add(directory)
+        self.watch_timer.start()
+
+    # 对比变化目录的内容，增量更新
+    def apply_directory_changes(self):
+        added = []
+        removed = set()
+        while self.changed_directories:
+            directory = self.changed_directories.pop()
+            known = self.directory_images.get(directory, set())
+            if not os.path.isdir(directory):
+                prefix = os.path.join(directory, "")
+                for gone in [d for d in self.directory_images if d == directory or d.startswith(prefix)]:
+                    removed |= self.directory_images.pop(gone)
+                continue
+            current = set()
+            try:
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            if not is_skipped_directory(entry.name) and entry.path not in self.directory_images:
+                                # 新的子目录（复制或重命名的文件夹）在后台扫描
+                                self.directory_images[entry.path] = set()
+                                self.scan_subfolder(entry.path)
+                        elif is_image_file(entry.name):
+                            current.add(entry.path)
+            except OSError:
+                continue
+            # 正在后台删除或恢复的文件由 FileMover 完成后处理，
+            # 否则还没移走的文件会先被加回列表
+            added.extend(sorted(current - known - self.moving_paths))
+            removed |= known - current - self.moving_paths
+        if added or removed:
+            self.apply_image_changes(added, removed)
+
+    def scan_subfolder(self, folder):
+        scanner = FolderScanner(folder, parent=self)
+        scanner.batch_found.connect(self.on_subfolder_batch)
+        scanner.finished.connect(lambda: self.subfolder_scanners.remove(scanner))
+        self.subfolder_scanners.append(scanner)
+        scanner.start()
+
+    def on_subfolder_batch(self, directories, image_paths):
+        if self.sender() not in self.subfolder_scanners or self.sender().isInterruptionRequested():
+            return
+        for directory in directories:
+            self.directory_images.setdefault(directory, set())
+            if len(self.folder_watcher.directories()) < MAX_WATCHED_DIRECTORIES:
+                self.folder_watcher.addPath(directory)
+        # 监视器可能已经列出过这个目录
+        self.apply_image_changes(image_paths, set())
+
+    # in_place 时新增的图片按扫描顺序插回原来的位置（撤销删除），否则追加在末尾
+    def apply_image_changes(self, added, removed, in_place=False):
+        # 已在列表中的图片不再重复添加
+        added = [
+            path for path in OrderedDict.fromkeys(added)
+            if path not in self.directory_images.get(os.path.dirname(path), ())
+        ]
+        if not added and not removed:
+            return
+        # 重命名表现为删除一个路径并新增一个路径
+        for image_path in removed:
+            self.directory_images.get(os.path.dirname(image_path), set()).discard(image_path)
+        for image_path in added:
+            self.directory_images.setdefault(os.path.dirname(image_path), set()).add(image_path)
+        self.all_images = [path for path in self.all_images if path not in removed]
+        if in_place:
+            keys = [scan_order_key(path) for path in self.all_images]
+            for image_path in sorted(added, key=scan_order_key):
+                key = scan_order_key(image_path)
+                row = bisect.bisect(keys, key)
+                keys.insert(row, key)
+                self.all_images.insert(row, image_path)
+        else:
+            self.all_images += added
+        self.thumbnail_loader.forget_identities(removed.union(added))
+        self.image_model.clear_pixmaps(removed)
+        self.preview_loader.forget(removed.union(added))
+        if self.preview_path in removed:
+            self.close_preview()
+        if removed:
+            self.metadata_index.remove(removed)
+        if self.filters_active():
+            # 新文件索引完成后再刷新列表
+            self.images = [path for path in self.images if path not in removed]
+            self.image_model.remove_images(removed)
+        elif self.sort_ascending is not None:
+            self.images = [path for path in self.images if path not in removed] + added
+            self.image_set = set(self.images)
+            self.image_model.remove_images(removed)
+            self.image_model.append_images(added)
+        elif in_place and added:
+            self.images = self.all_images
+            scroll_position = self.image_list.verticalScrollBar().value()
+            self.load_images()
+            self.image_list.verticalScrollBar().setValue(scroll_position)
+        else:
+            self.images = self.all_images
+            self.image_model.remove_images(removed)
+            self.image_model.append_images(added)
+        if removed and self.collapse_bursts_checkbox.isChecked():
+            # 代表图片被删除后由同组的另一张代替
+            self.load_images()
+        if added:
+            self.start_indexing(added)
+
+    def check_volumes(self, *args):
+        volumes = mounted_volumes()
+        new_volumes = volumes - self.known_volumes
+        self.known_volumes = volumes
+        for volume in sorted(new_volumes):
+            folder = os.path.join(volume, "DCIM")
+            if not os.path.isdir(folder):
+                continue
+            reply = QMessageBox.question(
+                self, "检测到存储卡", f"检测到新的存储卡 {volume}，是否打开？",
+                QMessageBox.Yes | QMessageBox.No, QMessageBox.Yes
+            )
+            if reply == QMessageBox.Yes:
+                self.open_folder(folder)
+            break
+
+    # 建立全部索引，或只增量索引 image_paths
+    def start_indexing(self, image_paths=None):
+        if image_paths is not None:
+            self.pending_index_paths.update(image_paths)
+            if self.metadata_indexer is not None and self.metadata_indexer.isRunning():
+                return
+            image_paths, self.pending_index_paths = self.pending_index_paths, set()
+            prune = False
+        else:
+            self.stop_thread(self.metadata_indexer)
+            self.pending_index_paths = set()
+            image_paths = self.all_images
+            prune = True
+        self.metadata_indexer = MetadataIndexer(
+            self.index_path, self.current_folder, image_paths, prune=prune, parent=self
+        )
+        self.metadata_indexer.progress.connect(self.on_index_progress)
+        self.metadata_indexer.finished.connect(self.on_index_finished)
+        self.metadata_indexer.start()
+
+    def on_index_progress(self, done, total):
+        if done < total:
+            self.statusBar().showMessage(f"正在建立元数据索引 {done}/{total}")
+
+    def on_index_finished(self):
+        if self.sender() is not self.metadata_indexer or self.metadata_indexer.isInterruptionRequested():
+            return
+        self.update_filter_options()
+        if self.filters_active() or self.sort_ascending is not None:
+            self.apply_filters()
+        if self.collapse_bursts_checkbox.isChecked():
+            self.start_grouping()
+        if self.pending_index_paths:
+            self.start_indexing(())
+
+    def update_filter_options(self):
+        for combo, column in ((self.camera_combo, "model"), (self.file_type_combo, "file_type")):
+            current = combo.currentData()
+            combo.blockSignals(True)
+            combo.clear()
+            combo.addItem("全部", None)
+            for value in self.metadata_index.distinct(column, self.current_folder):
+                combo.addItem(value or "未知", value or "")
+            index = combo.findData(current)
+            combo.setCurrentIndex(index if index >= 0 else 0)
+            combo.blockSignals(False)
+
+    def filters_active(self):
+        return (self.date_filter is not None
+                or self.camera_combo.currentData() is not None
+                or self.file_type_combo.currentData() is not None)
+
+    def apply_filters(self):
+        if not self.filters_active() and self.sort_ascending is None:
+            self.images = self.all_images
+        else:
+            start, end = self.date_filter or (None, None)
+            self.images = self.metadata_index.query(
+                self.current_folder, start, end,
+                model=self.camera_combo.currentData(),
+                file_type=self.file_type_combo.currentData(),
+                ascending=self.sort_ascending,
+            )
+            if not self.filters_active():
+                # 只排序时，尚未索引的文件按扫描顺序排在后面
+                self.image_set = set(self.images)
+                self.images += [path for path in self.all_images if path not in self.image_set]
+                self.image_set.update(self.images)
+            elif self.metadata_indexer is not None and self.metadata_indexer.isRunning():
+                self.statusBar().showMessage("元数据索引尚未完成，筛选结果可能不完整")
+        self.load_images()
 
     def load_images(self):
-        self.image_list.clear()
-        for image_path in self.images:
-            thumbnail_data = self.cache.get(image_path)
+        if self.collapse_bursts_checkbox.isChecked() and self.burst_groups:
+            # 每组以当前顺序中的第一张作为代表
+            representatives = {}
+            group_sizes = {}
+            for image_path in self.images:
+                label = self.burst_groups.get(image_path, image_path)
+                representative = representatives.setdefault(label, image_path)
+                group_sizes[representative] = group_sizes.get(representative, 0) + 1
+            images = list(representatives.values())
+            group_sizes = {path: size for path, size in group_sizes.items() if size > 1}
+            self.image_model.set_images(images, group_sizes)
+        else:
+            self.image_model.set_images(self.images)
+        if self.preview_path not in self.image_model.rows:
+            self.close_preview()
 
-            if thumbnail_data is not None:
-                thumbnail = QPixmap()
-                thumbnail.loadFromData(QByteArray(thumbnail_data))
-            else:
-                thumbnail = self.generate_thumbnail(image_path)
-                buffer = QBuffer()
-                buffer.open(QBuffer.ReadWrite)
-                thumbnail.save(buffer, "PNG")
-                thumbnail_data = buffer.data()
-                self.cache.set(image_path, thumbnail_data)
-
-            icon = QIcon(thumbnail)
-            item = QListWidgetItem(os.path.basename(image_path))
-            item.setIcon(icon)
-            item.setCheckState(Qt.Unchecked)
-            item.setData(Qt.UserRole, image_path)  # Store the image path as item data
-            self.image_list.addItem(item)
-
-        self.image_list.itemChanged.connect(self.on_item_changed)
-
-
-    def generate_thumbnail(self, image_path):
-        # Open the image using PIL.Image
-        image = Image.open(image_path)
-        # Resize the image and keep the aspect ratio
-        image.thumbnail((self.thumbnail_size.width(), self.thumbnail_size.height()), Image.ANTIALIAS)
-        # Convert the PIL.Image to QImage using ImageQt
-        if image.mode != 'RGBA':
-            image = image.convert('RGBA')
-        qimage = ImageQt(image)
-        # Convert QImage to QPixmap
-        pixmap = QPixmap.fromImage(qimage)
-        # Return the QPixmap
-        return pixmap
+    def toggle_burst_grouping(self, checked):
+        indexing = self.metadata_indexer is not None and self.metadata_indexer.isRunning()
+        if checked and not self.burst_groups and not indexing:
+            # 否则等索引有了拍摄时间后再分组
+            self.start_grouping()
+        self.load_images()
 
-    def clear_thumbnail_cache(self):
-        self.cache.clear()
-        QMessageBox.information(self, "清理完成", "缩略图缓存已清理。")
+    def start_grouping(self):
+        self.stop_thread(self.burst_grouper)
+        self.burst_grouper = BurstGrouper(
+            self.cache, self.index_path, self.current_folder, self.all_images, parent=self
+        )
+        self.burst_grouper.progress.connect(self.on_grouping_progress)
+        self.burst_grouper.finished.connect(self.on_grouping_finished)
+        self.statusBar().showMessage("正在查找连拍和相似照片")
+        self.burst_grouper.start()
 
-    def zoom_in(self):
-        self.set_thumbnail_size(self.thumbnail_size.width() * 1.2)
+    def on_grouping_progress(self, done, total):
+        if done < total:
+            self.statusBar().showMessage(f"正在为相似照片比对生成缩略图 {done}/{total}")
 
-    def zoom_out(self):
-        self.set_thumbnail_size(self.thumbnail_size.width() * 0.8)
+    def on_grouping_finished(self):
+        if self.sender() is not self.burst_grouper or self.burst_grouper.isInterruptionRequested():
+            return
+        self.burst_groups = self.burst_grouper.groups
+        group_count = len(set(self.burst_groups.values()))
+        self.statusBar().showMessage(
+            f"{len(self.burst_groups)} 张照片合并为 {group_count} 组", 5000
+        )
+        if self.collapse_bursts_checkbox.isChecked():
+            self.load_images()
 
-    def set_thumbnail_size(self, size):
-        self.thumbnail_size = QSize(size, size)
+    def refresh_thumbnails(self):
+        self.zoom_timer.stop()
+        self.image_model.set_level(thumbnail_level(self.thumbnail_size.width()))
+
+    def apply_icon_size(self):
         self.image_list.setIconSize(self.thumbnail_size)
+        # 固定网格大小，布局不受文件名长度影响
+        self.image_list.setGridSize(
+            QSize(self.thumbnail_size.width() + 24, self.thumbnail_size.height() + 36)
+        )
+
+    def on_thumbnail_progress(self, done, total):
+        if done < total:
+            self.statusBar().showMessage(f"正在生成缩略图 {done}/{total}")
+        else:
+            self.statusBar().showMessage(f"共 {len(self.images)} 张照片", 5000)
+
+    def clear_thumbnail_cache(self):
+        self.thumbnail_loader.cancel()
+        self.cache.clear()
+        self.image_model.clear_pixmaps()
+        self.load_images()
+        QMessageBox.information(self, "清理完成", "缩略图缓存已清理。")
+
+    def clear_card_thumbnail_cache(self):
+        self.thumbnail_loader.cancel()
+        count = self.cache.drop_namespace(self.cache.namespace)
+        self.image_model.clear_pixmaps()
         self.load_images()
+        QMessageBox.information(self, "清理完成", f"已清理当前存储卡的 {count} 个缩略图。")
 
-    def on_item_changed(self, item):
-        item.setSelected(item.checkState() == Qt.Checked)
+    def update_cache_stats(self):
+        stats = self.cache.stats()
+        lookups = stats["hits"] + stats["misses"]
+        hit_rate = 100 * stats["hits"] / lookups if lookups else 0
+        self.cache_stats_label.setText(
+            f"缓存命中 {hit_rate:.0f}% ({stats['hits']}/{lookups}) · "
+            f"{stats['bytes'] / 1024 / 1024:.0f} MB · 淘汰 {stats['evictions']} · "
+            f"解码 {stats['decode_ms']:.0f} ms/张"
+        )
 
     def on_open_folder_clicked(self):
         folder = QFileDialog.getExistingDirectory(self, "选择一个文件夹", self.root_folder)
         if folder:
-            self.current_folder = folder
-            self.images = self.create_image_list()
-            self.load_images()
+            self.open_folder(folder)
+
+    def open_folder(self, folder):
+        self.current_folder = folder
+        # 排序只对当前文件夹有效
+        self.sort_ascending = None
+        self.cache.namespace = volume_namespace(folder)
+        self.thumbnail_loader.forget_identities()
+        self.start_scan()
 
     def apply_date_filter(self):
         start_date = self.start_date_edit.date().toPyDate()
-        end_date = self.end_date_edit.date().toPyDate()
-        self.images = [image for image in self.create_image_list() if self.is_image_within_date_range(image, start_date, end_date)]
-        self.load_images()
+        end_date = self.end_date_edit.date().toPyDate() + datetime.timedelta(days=1)
+        self.date_filter = (
+            datetime.datetime.combine(start_date, datetime.time()).timestamp(),
+            datetime.datetime.combine(end_date, datetime.time()).timestamp(),
+        )
+        self.apply_filters()
 
     def select_today(self):
         today = datetime.date.today()
@@ -254,54 +2492,272 @@ class App(QMainWindow):
         self.apply_date_filter()
         
     def cancel_date_filter(self):
-        self.images = self.create_image_list()
-        self.load_images()
-
-    def is_image_within_date_range(self, image_path, start_date, end_date):
-            image_date = self.get_image_date(image_path)
-            return start_date <= image_date <= end_date
-
-    def get_image_date(self, image_path):
-        try:
-            with Image.open(image_path) as img:
-                exif_data = img._getexif()
-            if exif_data:
-                for tag, value in exif_data.items():
-                    if TAGS.get(tag) == "DateTime":
-                        return datetime.datetime.strptime(value, "%Y:%m:%d %H:%M:%S").date()
-        except Exception as e:
-            print(f"Error reading image metadata: {e}")
-        return datetime.datetime.fromtimestamp(os.path.getmtime(image_path)).date()
+        self.date_filter = None
+        self.apply_filters()
 
     def delete_images(self):
-        selected_items = [self.image_list.item(i) for i in range(self.image_list.count()) if self.image_list.item(i).isSelected()]
+        if self.file_mover is not None and self.file_mover.isRunning():
+            self.statusBar().showMessage("正在处理上一次删除，请稍候")
+            return
 
-        if not selected_items:
+        selected_paths = [
+            index.data(ImageListModel.PathRole)
+            for index in self.image_list.selectionModel().selectedRows()
+        ]
+
+        if not selected_paths:
             QMessageBox.information(self, "没有选择图片", "请选择图片进行删除.")
             return
 
-        reply = QMessageBox.question(self, "删除图片", "你确定要删除选中的图片吗?",
+        if self.delete_pairs_checkbox.isChecked():
+            pairs = group_pairs(self.all_images)
+            selected_paths = list(OrderedDict.fromkeys(
+                path for selected in selected_paths for path in pairs.get(pair_key(selected), [selected])
+            ))
+
+        use_trash = self.use_trash_checkbox.isChecked()
+        message = f"你确定要删除选中的 {len(selected_paths)} 张图片吗?"
+        if not use_trash:
+            message += "\n文件将被永久删除，无法撤销。"
+        reply = QMessageBox.question(self, "删除图片", message,
                                     QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+        if reply != QMessageBox.Yes:
+            return
 
-        if reply == QMessageBox.Yes:
-            for item in selected_items:
-                image_path = item.data(Qt.UserRole)  # Get the image path from item data
-                try:
-                    os.remove(image_path)
-                except Exception as e:
-                    print(f"Error deleting image: {e}")
-                    QMessageBox.critical(self, "Error", f"Error deleting image: {e}")
-                self.image_list.takeItem(self.image_list.row(item))
+        if use_trash:
+            batch_folder = os.path.join(
+                self.current_folder, TRASH_FOLDER, datetime.datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+            )
+            operations = [
+                ("trash", path, os.path.join(batch_folder, os.path.relpath(path, self.current_folder)), None)
+                for path in selected_paths
+            ]
+        else:
+            batch_folder = None
+            operations = [("delete", path, None, None) for path in selected_paths]
+
+        # 先从列表中移除，文件操作在后台进行
+        scroll_position = self.image_list.verticalScrollBar().value()
+        self.apply_image_changes([], set(selected_paths))
+        self.image_list.verticalScrollBar().setValue(scroll_position)
+        folder = self.current_folder
+        self.run_file_operations(operations, lambda mover: self.on_delete_finished(mover, folder, batch_folder))
+
+    def run_file_operations(self, operations, on_finished):
+        # 监视器忽略这些路径，直到操作完成
+        self.moving_paths = {path for kind, path, _, _ in operations if kind in ("trash", "delete", "restore")}
+        self.file_mover = FileMover(operations, self.cache, parent=self)
+        self.file_mover.progress.connect(
+            lambda done, total: self.statusBar().showMessage(f"正在处理文件 {done}/{total}")
+        )
+        self.file_mover.finished.connect(
+            lambda mover=self.file_mover: self.on_file_operations_finished(mover, on_finished)
+        )
+        self.file_mover.start()
+
+    def on_file_operations_finished(self, mover, on_finished):
+        self.moving_paths = set()
+        on_finished(mover)
+
+    # 所有失败汇总成一个对话框
+    def report_failures(self, title, failures):
+        lines = [f"{os.path.basename(path)}: {error}" for path, error in failures[:20]]
+        if len(failures) > 20:
+            lines.append(f"... 以及另外 {len(failures) - 20} 个文件")
+        QMessageBox.warning(self, title, f"{len(failures)} 个文件处理失败:\n" + "\n".join(lines))
+
+    def on_delete_finished(self, mover, folder, batch_folder):
+        if batch_folder is not None and mover.done:
+            self.trash_batches.append((folder, batch_folder, mover.done))
+            self.undo_delete_button.setEnabled(True)
+        self.statusBar().showMessage(f"已删除 {len(mover.done)} 张照片", 5000)
+        if mover.failures:
+            if folder == self.current_folder:
+                # 把删除失败的文件放回列表
+                self.apply_image_changes([path for path, _ in mover.failures], set())
+            self.report_failures("删除失败", mover.failures)
+
+    def undo_delete(self):
+        if not self.trash_batches or (self.file_mover is not None and self.file_mover.isRunning()):
+            return
+        folder, batch_folder, operations = self.trash_batches.pop()
+        self.undo_delete_button.setEnabled(bool(self.trash_batches))
+        restores = [("restore", path, target, identity) for _, path, target, identity in operations]
+        # 最后删除空的回收站目录，恢复失败的文件保留在原处
+        restores.append(("prune", batch_folder, batch_folder, None))
+        self.run_file_operations(restores, lambda mover: self.on_undo_finished(mover, folder))
+
+    def on_undo_finished(self, mover, folder):
+        restored = [path for kind, path, _, _ in mover.done if kind == "restore"]
+        if folder == self.current_folder:
+            # 已切换到其他存储卡时，文件只放回原处，不加入当前列表
+            self.apply_image_changes(restored, set(), in_place=True)
+        self.statusBar().showMessage(f"已恢复 {len(restored)} 张照片", 5000)
+        if mover.failures:
+            self.report_failures("恢复失败", mover.failures)
+
+    # 永久删除本次移到回收站的文件，然后删除回收站文件夹
+    def trash_purge_operations(self):
+        operations = [
+            ("purge", path, target, identity)
+            for _, _, batch in self.trash_batches for _, path, target, identity in batch
+        ]
+        trash_folders = {os.path.dirname(batch_folder) for _, batch_folder, _ in self.trash_batches}
+        trash_folders.add(os.path.join(self.current_folder, TRASH_FOLDER))
+        operations.extend(("purge", folder, folder, None) for folder in sorted(trash_folders))
+        return operations
+
+    def empty_trash(self):
+        if self.file_mover is not None and self.file_mover.isRunning():
+            return
+        reply = QMessageBox.question(self, "清空回收站", "回收站中的照片将被永久删除，无法撤销。是否继续?",
+                                    QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+        if reply != QMessageBox.Yes:
+            return
+        operations = self.trash_purge_operations()
+        self.trash_batches = []
+        self.undo_delete_button.setEnabled(False)
+        self.run_file_operations(operations, self.on_empty_trash_finished)
+
+    def on_empty_trash_finished(self, mover):
+        self.statusBar().showMessage("回收站已清空", 5000)
+        if mover.failures:
+            self.report_failures("清空回收站失败", mover.failures)
+
+    def ingest_images(self):
+        if self.ingester is not None and self.ingester.isRunning():
+            self.statusBar().showMessage("正在导入，请稍候")
+            return
+
+        # 没有选中时导入当前筛选结果
+        image_paths = [
+            index.data(ImageListModel.PathRole)
+            for index in self.image_list.selectionModel().selectedRows()
+        ] or self.images
+        if not image_paths:
+            QMessageBox.information(self, "没有图片", "没有可导入的图片.")
+            return
+
+        destination = QFileDialog.getExistingDirectory(
+            self, "选择导入目标文件夹", self.ingest_destination or os.path.expanduser("~")
+        )
+        if not destination:
+            return
+        source = os.path.realpath(self.current_folder)
+        if os.path.realpath(destination) == source or os.path.realpath(destination).startswith(source + os.sep):
+            QMessageBox.warning(self, "无法导入", "目标文件夹不能位于当前文件夹之内.")
+            return
+        self.ingest_destination = destination
+
+        # RAW 文件和对应的 JPEG 一起复制，要么都不复制
+        pairs = group_pairs(self.all_images)
+        units = list(OrderedDict(
+            (pair_key(path), pairs.get(pair_key(path), [path])) for path in image_paths
+        ).values())
+        self.ingester = Ingester(units, self.current_folder, destination, parent=self)
+        self.ingester.progress.connect(
+            lambda done, total: self.statusBar().showMessage(f"正在导入 {done}/{total}")
+        )
+        self.ingester.finished.connect(self.on_ingest_finished)
+        self.ingester.start()
+
+    def on_ingest_finished(self):
+        ingester = self.ingester
+        if ingester.error is not None:
+            QMessageBox.warning(self, "导入失败", ingester.error)
+            return
+        copied, skipped, copied_bytes, failures = ingester.result
+        megabytes = copied_bytes / 1024 / 1024
+        speed = megabytes / ingester.seconds if ingester.seconds else 0
+        self.statusBar().showMessage(
+            f"已导入 {copied} 个文件 ({megabytes:.0f} MB, {speed:.0f} MB/s)，跳过 {skipped} 个已导入的文件",
+            10000,
+        )
+        if failures:
+            self.report_failures("导入失败", failures)
 
     def select_all_images(self):
-        for index in range(self.image_list.count()):
-            item = self.image_list.item(index)
-            item.setSelected(True)
+        self.image_list.selectAll()
 
     def deselect_all_images(self):
-        for index in range(self.image_list.count()):
-            item = self.image_list.item(index)
-            item.setSelected(False)
+        self.image_list.clearSelection()
+
+    def eventFilter(self, watched, event):
+        if watched is self.image_list and event.type() == QEvent.KeyPress and event.key() == Qt.Key_Space:
+            index = self.image_list.currentIndex()
+            if index.isValid():
+                self.open_preview(index.row())
+                return True
+        return super().eventFilter(watched, event)
+
+    def preview_size(self):
+        screen = self.windowHandle().screen() if self.windowHandle() else QApplication.primaryScreen()
+        geometry = screen.geometry()
+        return int(max(geometry.width(), geometry.height()) * screen.devicePixelRatio())
+
+    def open_preview(self, row):
+        if not 0 <= row < self.image_model.rowCount():
+            return
+        self.view_stack.setCurrentWidget(self.preview_pane)
+        self.preview_pane.setFocus()
+        self.show_preview(row)
+
+    def close_preview(self):
+        self.preview_path = None
+        self.view_stack.setCurrentWidget(self.image_list)
+        self.image_list.setFocus()
+        self.image_list.scrollTo(self.image_list.currentIndex())
+
+    def move_preview(self, delta):
+        row = self.image_list.currentIndex().row() + delta
+        if 0 <= row < self.image_model.rowCount():
+            self.show_preview(row)
+
+    def show_preview(self, row):
+        index = self.image_model.index(row)
+        self.image_list.setCurrentIndex(index)
+        paths = self.image_model.paths
+        self.preview_path = paths[row]
+        self.preview_final = False
+        neighbors = []
+        for distance in range(1, PREVIEW_PREFETCH + 1):
+            # 由近到远，前后方向同样对待
+            neighbors.extend(paths[r] for r in (row + distance, row - distance) if 0 <= r < len(paths))
+        size = self.preview_size()
+        cached = self.preview_loader.cached(self.preview_path, size)
+        if cached is None:
+            # 解码期间先显示列表中的缩略图
+            self.preview_pane.set_image(self.image_model.pixmap(self.preview_path), self.preview_caption(row))
+        self.preview_loader.request(self.preview_path, size, neighbors)
+
+    def preview_caption(self, row):
+        return f"{os.path.basename(self.image_model.paths[row])}  ({row + 1}/{self.image_model.rowCount()})"
+
+    def on_preview_ready(self, image_path, image, final):
+        if image_path != self.preview_path or self.preview_final:
+            return
+        self.preview_final = final
+        row = self.image_model.rows.get(image_path)
+        if row is not None:
+            self.preview_pane.set_image(QPixmap.fromImage(image), self.preview_caption(row))
+
+    def closeEvent(self, event):
+        if self.file_mover is not None:
+            self.file_mover.wait()
+        if self.trash_batches:
+            reply = QMessageBox.question(self, "清空回收站", "是否永久删除本次移到回收站的照片?",
+                                        QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+            if reply == QMessageBox.Yes:
+                FileMover(self.trash_purge_operations(), self.cache).run()
+        self.thumbnail_loader.shutdown()
+        self.preview_loader.shutdown()
+        self.stop_thread(self.folder_scanner)
+        for scanner in list(self.subfolder_scanners):
+            self.stop_thread(scanner)
+        self.stop_thread(self.metadata_indexer)
+        self.stop_thread(self.burst_grouper)
+        self.stop_thread(self.ingester)
+        super().closeEvent(event)
 
     def event(self, event):
         if event.type() == QEvent.Gesture:
@@ -319,6 +2775,8 @@ class App(QMainWindow):
         if changeFlags & QPinchGesture.ScaleFactorChanged:
             new_size = self.thumbnail_size.width() * gesture.scaleFactor()
             self.set_thumbnail_size(new_size)
+        if gesture.state() == Qt.GestureFinished:
+            self.refresh_thumbnails()
 
     def zoom_in(self):
         self.set_thumbnail_size(self.thumbnail_size.width() * 1.2)
@@ -327,12 +2785,108 @@ class App(QMainWindow):
         self.set_thumbnail_size(self.thumbnail_size.width() * 0.8)
 
     def set_thumbnail_size(self, size):
-        self.thumbnail_size = QSize(int(size), int(size))
-        self.image_list.setIconSize(self.thumbnail_size)
-        self.load_images()
+        size = int(max(MIN_THUMBNAIL_SIZE, min(MAX_THUMBNAIL_SIZE, size)))
+        self.thumbnail_size = QSize(size, size)
+        # 先只缩放图标，缩放或捏合结束后
+        # 再从缓存加载更清晰的缩略图
+        self.apply_icon_size()
+        self.zoom_timer.start()
 
-if __name__ == "__main__":
+
+def print_progress(label):
+    def progress(done, total):
+        if total and done and (done == total or done % 100 == 0):
+            print(f"\r{label} {done}/{total}", end="\n" if done == total else "", file=sys.stderr, flush=True)
+    return progress
+
+
+def rate(count, seconds):
+    return f"{seconds:.1f} s ({count / seconds if seconds else 0:.0f} 张/s)"
+
+
+# 命令行：不打开界面，预先生成缩略图缓存和元数据索引
+def index_command(argv):
+    parser = argparse.ArgumentParser(
+        prog="SDCardQuickView.py index", description="预先生成缩略图缓存和元数据索引"
+    )
+    parser.add_argument("folder", help="要索引的文件夹，例如存储卡的 DCIM 目录")
+    parser.add_argument("--workers", type=int, default=THUMBNAIL_WORKERS, help="生成缩略图的进程数")
+    parser.add_argument("--metadata-workers", type=int, default=METADATA_WORKERS, help="读取元数据的线程数")
+    parser.add_argument("--no-thumbnails", action="store_true", help="只建立元数据索引")
+    args = parser.parse_args(argv)
+    folder = os.path.abspath(args.folder)
+
+    started = time.perf_counter()
+    image_paths = create_image_list(folder)
+    print(f"扫描: {len(image_paths)} 张照片, {rate(len(image_paths), time.perf_counter() - started)}")
+
+    started = time.perf_counter()
+    index = MetadataIndex(METADATA_INDEX_PATH)
+    try:
+        written = update_metadata_index(
+            index, folder, image_paths, workers=args.metadata_workers, progress=print_progress("元数据")
+        )
+    finally:
+        index.close()
+    print(f"元数据: 更新 {written} 个文件, {rate(written, time.perf_counter() - started)}")
+
+    if not args.no_thumbnails:
+        started = time.perf_counter()
+        cache = ThumbnailCache(THUMBNAIL_CACHE_FOLDER)
+        cache.namespace = volume_namespace(folder)
+        try:
+            hits, generated, failures = warm_thumbnail_cache(
+                cache, image_paths, args.workers, progress=print_progress("缩略图")
+            )
+            cache.maintain()
+            stats = cache.stats()
+        finally:
+            cache.close()
+        print(f"缩略图: 生成 {generated}, 已缓存 {hits}, 失败 {len(failures)}, "
+              f"{rate(generated, time.perf_counter() - started)}")
+        print(f"缓存: {stats['bytes'] / 1024 / 1024:.0f} MB, 淘汰 {stats['evictions']}, "
+              f"解码 {stats['decode_ms']:.0f} ms/张")
+        for image_path, error in failures:
+            print(f"  {image_path}: {error}", file=sys.stderr)
+    return 0
+
+
+# 命令行：不打开界面，导入存储卡中的照片
+def ingest_command(argv):
+    parser = argparse.ArgumentParser(
+        prog="SDCardQuickView.py ingest", description="把照片复制到目标文件夹并校验"
+    )
+    parser.add_argument("folder", help="要导入的文件夹，例如存储卡的 DCIM 目录")
+    parser.add_argument("destination", help="目标文件夹")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS, help="复制线程数")
+    args = parser.parse_args(argv)
+    folder = os.path.abspath(args.folder)
+
+    units = list(group_pairs(create_image_list(folder)).values())
+    started = time.perf_counter()
+    copied, skipped, copied_bytes, failures = ingest(
+        units, folder, os.path.abspath(args.destination), args.workers, progress=print_progress("导入")
+    )
+    seconds = time.perf_counter() - started
+    print(f"导入: 复制 {copied}, 跳过 {skipped}, 失败 {len(failures)}, "
+          f"{copied_bytes / 1024 / 1024:.0f} MB, {rate(copied, seconds)}")
+    for image_path, error in failures:
+        print(f"  {image_path}: {error}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "index":
+        return index_command(argv[1:])
+    if argv and argv[0] == "ingest":
+        return ingest_command(argv[1:])
     app = QApplication(sys.argv)
     window = App()
     window.show()
-    sys.exit(app.exec_())
\ No newline at end of file
+    return app.exec_()
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
\ No newline at end of file
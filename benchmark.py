@@ -0,0 +1,284 @@
+"""Performance benchmarks for SDCardQuickView.
+
+Builds a synthetic card tree (nested DCIM folders with JPEG and TIFF files of
+realistic resolution and EXIF capture dates) and measures scanning, thumbnail
+generation, the thumbnail cache, metadata extraction and date filtering.
+Results are printed and can be written as JSON to compare commits:
+
+    python benchmark.py --output before.json
+    python benchmark.py --output after.json --compare before.json
+
+Only needs a CPU; no display is required.  With the defaults the synthetic
+card takes about 1.4 GB of temporary space (``--card`` keeps it for reuse).
+"""
+import argparse
+import datetime
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+from PIL import Image
+
+import SDCardQuickView as quickview
+
+
+def exif_block(taken_at, make, model):
+    """APP1 segment with Make/Model in IFD0 and DateTimeOriginal in the Exif IFD."""
+    make = make.encode() + b"\0"
+    model = model.encode() + b"\0"
+    taken = taken_at.strftime("%Y:%m:%d %H:%M:%S").encode() + b"\0"
+    ifd0_size = 2 + 3 * 12 + 4
+    exif_offset = 8 + ifd0_size
+    data_offset = exif_offset + 2 + 12 + 4
+    ifd0 = struct.pack("<H", 3)
+    ifd0 += struct.pack("<HHII", 0x010F, 2, len(make), data_offset)
+    ifd0 += struct.pack("<HHII", 0x0110, 2, len(model), data_offset + len(make))
+    ifd0 += struct.pack("<HHII", 0x8769, 4, 1, exif_offset)
+    ifd0 += struct.pack("<I", 0)
+    exif_ifd = struct.pack("<H", 1)
+    exif_ifd += struct.pack("<HHII", 0x9003, 2, len(taken), data_offset + len(make) + len(model))
+    exif_ifd += struct.pack("<I", 0)
+    tiff = b"II*\0" + struct.pack("<I", 8) + ifd0 + exif_ifd + make + model + taken
+    return b"\xff\xe1" + struct.pack(">H", len(tiff) + 8) + b"Exif\0\0" + tiff
+
+
+def base_image(width, height, seed):
+    """A photo-like image: smooth gradients plus sensor-like noise."""
+    gradient = Image.linear_gradient("L").resize((width, height))
+    noise = Image.effect_noise((width, height), 40)
+    channels = [
+        Image.blend(gradient.rotate(90 * ((seed + channel) % 4)), noise, 0.3)
+        for channel in range(3)
+    ]
+    return Image.merge("RGB", channels)
+
+
+def build_card(root, files, width, height, tiff_every, seed=0):
+    """Create ``files`` images under ``root/DCIM/1xxTEST`` with 999 files per folder."""
+    jpeg_streams = []
+    for variant in range(4):
+        buffer = io.BytesIO()
+        base_image(width, height, seed + variant).save(buffer, "JPEG", quality=92)
+        jpeg_streams.append(buffer.getvalue())
+    tiff_image = base_image(width, height, seed + 99)
+    cameras = [("Canon", "EOS R5"), ("SONY", "ILCE-7RM4"), ("NIKON CORPORATION", "NIKON Z 7_2")]
+    started = datetime.datetime(2023, 1, 1, 8, 0, 0)
+    for number in range(files):
+        folder = os.path.join(root, "DCIM", "%03dTEST" % (100 + number // 999))
+        os.makedirs(folder, exist_ok=True)
+        taken_at = started + datetime.timedelta(minutes=number * 7)
+        make, model = cameras[number % len(cameras)]
+        if tiff_every and number % tiff_every == tiff_every - 1:
+            exif = Image.Exif()
+            exif[0x010F] = make
+            exif[0x0110] = model
+            exif[0x0132] = taken_at.strftime("%Y:%m:%d %H:%M:%S")
+            tiff_image.save(
+                os.path.join(folder, "IMG_%04d.TIF" % number), exif=exif, compression="tiff_adobe_deflate"
+            )
+        else:
+            stream = jpeg_streams[number % len(jpeg_streams)]
+            with open(os.path.join(folder, "IMG_%04d.JPG" % number), "wb") as f:
+                f.write(stream[:2] + exif_block(taken_at, make, model) + stream[2:])
+
+
+def estimated_card_bytes(files, width, height, tiff_every):
+    """Rough size of ``build_card`` output (noisy images barely compress)."""
+    tiffs = files // tiff_every if tiff_every else 0
+    return int(width * height * (0.45 * (files - tiffs) + 2.5 * tiffs))
+
+
+def summarize(latencies, seconds=None):
+    """files/s plus p50/p95 latency (ms) for a list of per-item seconds."""
+    ordered = sorted(latencies)
+    count = len(ordered)
+    seconds = sum(ordered) if seconds is None else seconds
+    return {
+        "count": count,
+        "seconds": round(seconds, 4),
+        "files_per_s": round(count / seconds, 1) if seconds else None,
+        "p50_ms": round(statistics.median(ordered) * 1000, 3) if ordered else None,
+        "p95_ms": round(ordered[min(count - 1, int(count * 0.95))] * 1000, 3) if ordered else None,
+    }
+
+
+def timed(function, items):
+    latencies = []
+    started = time.perf_counter()
+    for item in items:
+        begin = time.perf_counter()
+        function(item)
+        latencies.append(time.perf_counter() - begin)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def run(args, root, work):
+    results = {}
+    sample_random = random.Random(args.seed)
+
+    # Folder scan, repeated so the result is not just the cold page cache
+    scans = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        image_paths = quickview.create_image_list(root)
+        scans.append(time.perf_counter() - started)
+    results["scan"] = {
+        "count": len(image_paths),
+        "seconds": round(statistics.median(scans), 4),
+        "files_per_s": round(len(image_paths) / statistics.median(scans), 1),
+    }
+
+    sample = sample_random.sample(image_paths, min(args.sample, len(image_paths)))
+
+    # Metadata, one file at a time and through the batch API
+    results["metadata"] = timed(quickview.read_image_metadata, image_paths)
+    started = time.perf_counter()
+    rows = list(quickview.read_metadata_batch([(path, os.stat(path)) for path in image_paths]))
+    seconds = time.perf_counter() - started
+    results["metadata_batch"] = {
+        "count": len(rows),
+        "seconds": round(seconds, 4),
+        "files_per_s": round(len(rows) / seconds, 1),
+    }
+
+    # Date filtering against the index
+    index = quickview.MetadataIndex(os.path.join(work, "index.sqlite3"))
+    started = time.perf_counter()
+    quickview.update_metadata_index(index, root, image_paths)
+    seconds = time.perf_counter() - started
+    results["index_build"] = {
+        "count": len(image_paths),
+        "seconds": round(seconds, 4),
+        "files_per_s": round(len(image_paths) / seconds, 1),
+    }
+    first = min(row["taken_at"] for row in rows)
+    last = max(row["taken_at"] for row in rows)
+    ranges = []
+    for _ in range(args.queries):
+        start = sample_random.uniform(first, last)
+        ranges.append((start, start + 7 * 24 * 3600))
+    results["date_filter"] = timed(lambda r: index.query(root, r[0], r[1], ascending=True), ranges)
+    index.close()
+
+    # Thumbnail extraction and the full pyramid a cache miss produces
+    results["thumbnail_128"] = timed(lambda path: quickview.extract_thumbnail(path, 128), sample)
+    pyramids = {}
+
+    def build_pyramid(path):
+        pyramids[path] = quickview.generate_thumbnail_pyramid(path)
+
+    results["thumbnail_pyramid"] = timed(build_pyramid, sample)
+
+    # Images smaller than the requested size (phone photos under a 5K preview)
+    small_path = os.path.join(work, "small.jpg")
+    base_image(300, 200, args.seed).save(small_path, "JPEG", quality=92)
+    results["thumbnail_small"] = timed(
+        lambda path: quickview.extract_thumbnail(path, 5120).convert("RGB"), [small_path] * 20
+    )
+
+    # Cache miss (lookup + store) and hit (lookup + decode) paths
+    cache = quickview.ThumbnailCache(os.path.join(work, "thumbnails"))
+    keys = {path: quickview.file_identity(path) for path in sample}
+
+    def miss(path):
+        if cache.get(keys[path] + (128,)) is None:
+            cache.store_pyramid(keys[path], pyramids[path])
+
+    def hit(path):
+        Image.open(io.BytesIO(cache.get(keys[path] + (128,)))).load()
+
+    results["cache_miss"] = timed(miss, sample)
+    results["cache_hit"] = timed(hit, sample)
+    results["cache_size"] = {
+        "count": len(sample),
+        "bytes_per_image": round(cache.stats()["bytes"] / len(sample)) if sample else None,
+    }
+    cache.close()
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def compare(results, baseline):
+    print("\n与基准对比 (files/s, >1 表示更快):")
+    for name, result in results.items():
+        old = baseline.get("results", {}).get(name)
+        if not old or not old.get("files_per_s") or not result.get("files_per_s"):
+            continue
+        print(f"  {name:18s} {result['files_per_s'] / old['files_per_s']:6.2f}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="SDCardQuickView 性能基准测试")
+    parser.add_argument("--files", type=int, default=500, help="合成存储卡中的照片数量")
+    parser.add_argument("--width", type=int, default=3000)
+    parser.add_argument("--height", type=int, default=2000)
+    parser.add_argument("--tiff-every", type=int, default=100, help="每 N 张中有一张 TIFF，0 表示不生成")
+    parser.add_argument("--sample", type=int, default=200, help="缩略图和缓存测试使用的照片数量")
+    parser.add_argument("--queries", type=int, default=200, help="日期筛选查询次数")
+    parser.add_argument("--repeat", type=int, default=3, help="扫描重复次数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--card", help="使用（或在此生成并保留）合成存储卡目录")
+    parser.add_argument("--output", help="把结果写入 JSON 文件")
+    parser.add_argument("--compare", help="与之前保存的 JSON 结果对比")
+    args = parser.parse_args(argv)
+
+    work = tempfile.mkdtemp(prefix="quickview-bench-")
+    root = args.card or os.path.join(work, "card")
+    try:
+        if not os.path.isdir(os.path.join(root, "DCIM")):
+            needed = estimated_card_bytes(args.files, args.width, args.height, args.tiff_every)
+            os.makedirs(root, exist_ok=True)
+            free = shutil.disk_usage(root).free
+            print(f"合成存储卡约需 {needed / 1024 ** 3:.1f} GB，可用 {free / 1024 ** 3:.1f} GB", file=sys.stderr)
+            if needed > free:
+                print("磁盘空间不足，请减少 --files 或尺寸，或用 --card 指定其他位置", file=sys.stderr)
+                return 1
+            started = time.perf_counter()
+            build_card(root, args.files, args.width, args.height, args.tiff_every, args.seed)
+            print(f"生成合成存储卡: {args.files} 张, {time.perf_counter() - started:.1f} s", file=sys.stderr)
+        results = run(args, root, work)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    report = {
+        "environment": environment(),
+        "parameters": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "results": results,
+    }
+    for name, result in results.items():
+        print(f"{name:18s} " + "  ".join(f"{key}={value}" for key, value in result.items()))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())